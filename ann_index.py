@@ -0,0 +1,130 @@
+"""
+Approximate nearest-neighbor retrieval for TF-IDF product vectors.
+
+IVFIndex projects the sparse TF-IDF rows to a small dense space with
+TruncatedSVD, partitions the projected products into coarse clusters
+("inverted lists") and at query time only scans the n_probe lists whose
+centroids are closest to the query. It returns candidate product positions;
+callers re-score them exactly and apply their own filters.
+"""
+import numpy as np
+
+
+class IVFIndex:
+    def __init__(self, n_components=64, n_lists=None, n_probe=8, random_state=42):
+        """
+        Args:
+            n_components (int): Dimension of the dense projection
+            n_lists (int): Number of inverted lists (default ~4 * sqrt(n_products))
+            n_probe (int): Lists scanned per query by default; the recall-vs-latency knob
+            random_state (int): Seed for the projection and the list clustering
+        """
+        self.n_components = n_components
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.random_state = random_state
+
+    def fit(self, product_vectors):
+        # Only needed to build the index, not to load or query it
+        from sklearn.cluster import MiniBatchKMeans
+        from sklearn.decomposition import TruncatedSVD
+
+        n_products, n_terms = product_vectors.shape
+        n_components = max(1, min(self.n_components, n_terms - 1, n_products - 1))
+        svd = TruncatedSVD(n_components=n_components, random_state=self.random_state)
+        projection = svd.fit_transform(product_vectors).astype(np.float32)
+        self.components = svd.components_.astype(np.float32)
+        self.projection = _normalize_rows(projection)
+
+        n_lists = self.n_lists or int(4 * np.sqrt(n_products))
+        n_lists = max(1, min(n_lists, n_products))
+        coarse = MiniBatchKMeans(n_clusters=n_lists, random_state=self.random_state, n_init=3,
+                                 batch_size=4096)
+        labels = coarse.fit_predict(self.projection)
+        self.centroids = _normalize_rows(coarse.cluster_centers_.astype(np.float32))
+
+        # CSR-style layout: products of list l are list_items[list_offsets[l]:list_offsets[l + 1]]
+        self.list_items = np.argsort(labels, kind='stable').astype(np.int32)
+        self.list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=n_lists), out=self.list_offsets[1:])
+        print(f"IVF index built with {n_lists} lists over {n_components} dimensions")
+        return self
+
+    def update(self, product_vectors, positions):
+        """
+        Re-project the given rows and move them to their nearest existing list,
+        keeping the projection and centroids fixed. Positions at or beyond the
+        current number of products are appended.
+        Args:
+            product_vectors (scipy.sparse matrix): The full, updated TF-IDF matrix
+            positions (np.ndarray): Rows that were added or changed
+        """
+        n_lists = len(self.centroids)
+        labels = np.empty(len(self.projection), dtype=np.int64)
+        labels[self.list_items] = np.repeat(np.arange(n_lists), np.diff(self.list_offsets))
+
+        n_products = product_vectors.shape[0]
+        projection = np.zeros((n_products, self.projection.shape[1]), dtype=np.float32)
+        projection[:len(self.projection)] = self.projection
+        labels = np.concatenate([labels, np.zeros(n_products - len(labels), dtype=np.int64)])
+        rows = _normalize_rows((product_vectors[positions] @ self.components.T).astype(np.float32))
+        projection[positions] = rows
+        labels[positions] = np.argmax(rows @ self.centroids.T, axis=1)
+
+        self.projection = projection
+        self.list_items = np.argsort(labels, kind='stable').astype(np.int32)
+        self.list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=n_lists), out=self.list_offsets[1:])
+        return self
+
+    def search(self, query_vector, n_candidates, n_probe=None):
+        """
+        Args:
+            query_vector (scipy.sparse matrix): 1 x n_terms TF-IDF query
+            n_candidates (int): Maximum number of candidates to return
+            n_probe (int): Lists to scan; more lists = higher recall, more latency
+        Returns:
+            np.ndarray: Ascending positions of the candidate products
+        """
+        n_probe = self.n_probe if n_probe is None else n_probe
+        # Project only the query's non-zero terms: O(n_components * nnz)
+        query_vector = query_vector.tocsr()
+        query = self.components[:, query_vector.indices] @ query_vector.data.astype(np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0 or n_probe <= 0:
+            return np.empty(0, dtype=np.intp)
+        query /= norm
+
+        n_lists = len(self.centroids)
+        n_probe = min(n_probe, n_lists)
+        list_scores = self.centroids @ query
+        probe = np.argpartition(-list_scores, n_probe - 1)[:n_probe]
+        members = np.concatenate([
+            self.list_items[self.list_offsets[l]:self.list_offsets[l + 1]] for l in probe
+        ])
+        if len(members) > n_candidates:
+            approx_scores = self.projection[members] @ query
+            members = members[np.argpartition(-approx_scores, n_candidates - 1)[:n_candidates]]
+        return np.sort(members).astype(np.intp)
+
+    def to_arrays(self):
+        return {
+            'components': self.components,
+            'projection': self.projection,
+            'centroids': self.centroids,
+            'list_items': self.list_items,
+            'list_offsets': self.list_offsets,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, n_probe=8):
+        self = cls(n_components=arrays['components'].shape[0], n_lists=len(arrays['centroids']), n_probe=n_probe)
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        return self
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
@@ -0,0 +1,185 @@
+"""
+Benchmarks for the ml_module recommender on synthetic catalogs.
+
+    python benchmark.py ann --products 200000 --queries 200
+    python benchmark.py terms --products 1000000 --queries 500
+    python benchmark.py batch --products 200000 --queries 500 --batch-size 50
+    python benchmark.py memory --products 1000000
+    python benchmark.py imports --repeats 5
+"""
+import argparse
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import ml_module
+from sample_data import make_large_catalog, make_sample_catalog, to_products_table
+
+
+def make_queries(catalog, n_queries, seed=0):
+    """Queries made of 2-3 non-brand words drawn from random product titles"""
+    rng = random.Random(seed)
+    titles = catalog['title'].tolist()
+    queries = []
+    for _ in range(n_queries):
+        words = rng.choice(titles).split()[1:]
+        queries.append(" ".join(rng.sample(words, min(len(words), rng.randint(2, 3)))).lower())
+    return queries
+
+
+def time_queries(fn, queries):
+    """Run fn over all queries; returns (results, per-query latencies in ms)"""
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(fn(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, np.array(latencies)
+
+
+def report(label, latencies, baseline=None, extra=""):
+    speedup = f"{baseline.mean() / latencies.mean():7.1f}x" if baseline is not None else "      -"
+    print(f"{label:<24} mean {latencies.mean():8.2f} ms  p95 {np.percentile(latencies, 95):8.2f} ms  "
+          f"speedup {speedup}  {extra}")
+
+
+def build_model(n_products, small=False):
+    print(f"Building recommender on {n_products} synthetic products...")
+    catalog = make_sample_catalog(n_products) if small else make_large_catalog(n_products)
+    start = time.perf_counter()
+    model = ml_module.AmazonProductRecommender(product_data=to_products_table(catalog))
+    print(f"Trained in {time.perf_counter() - start:.1f}s")
+    return catalog, model
+
+
+def bench_ann(n_products, n_queries, top_n, probes):
+    catalog, model = build_model(n_products)
+    start = time.perf_counter()
+    model.build_ann_index(n_probe=probes[0])
+    print(f"ANN index built in {time.perf_counter() - start:.1f}s")
+    queries = make_queries(catalog, n_queries)
+
+    positions = {asin: i for i, asin in enumerate(model.product_data['asin'])}
+
+    def scores(query, recs):
+        query_vector = model.tfidf.transform([model.preprocess_text(query)])
+        similarities = (model.product_vectors @ query_vector.T).toarray().ravel()
+        return similarities, similarities[[positions[rec['asin']] for rec in recs]]
+
+    exact, exact_ms = time_queries(lambda q: model.get_recommendations_cosine(q, top_n, n_probe=0), queries)
+    report("exact", exact_ms)
+    # Many products tie on score, so recall counts a result as a hit when its
+    # exact score reaches the exact top_n-th score rather than comparing ASINs
+    thresholds = [scores(q, recs)[1].min() if recs else 0 for q, recs in zip(queries, exact)]
+    for n_probe in probes:
+        approx, approx_ms = time_queries(
+            lambda q: model.get_recommendations_cosine(q, top_n, n_probe=n_probe), queries)
+        hits = [np.sum(scores(q, recs)[1] >= kth - 1e-9) / top_n for q, recs, kth in zip(queries, approx, thresholds)]
+        report(f"ivf n_probe={n_probe}", approx_ms, exact_ms, f"recall@{top_n} {np.mean(hits):.3f}")
+
+
+def bench_terms(n_products, n_queries, top_n):
+    # The 2000-product demo catalog from recommendor.py, then a large one
+    for label, (catalog, model) in (("demo catalog", build_model(2000, small=True)),
+                                    ("large catalog", build_model(n_products))):
+        queries = make_queries(catalog, n_queries)
+        term_index = model.term_index
+        print(f"\n{label}: {len(model.product_data)} products, {len(queries)} queries")
+
+        def vector(query):
+            return model.tfidf.transform([model.preprocess_text(query)])
+
+        vectors = [vector(q) for q in queries]
+        _, full_score_ms = time_queries(lambda v: model.score_products(v), vectors)
+        _, index_score_ms = time_queries(
+            lambda v: model.score_products(v, term_index.search(v, top_n)), vectors)
+        report("scoring: full scan", full_score_ms)
+        report("scoring: term index", index_score_ms, full_score_ms)
+
+        model.term_index = None
+        full, full_ms = time_queries(lambda q: model.get_recommendations_cosine(q, top_n), queries)
+        model.term_index = term_index
+        indexed, indexed_ms = time_queries(lambda q: model.get_recommendations_cosine(q, top_n), queries)
+        mismatches = sum(a != b for a, b in zip(indexed, full))
+        report("end to end: full scan", full_ms)
+        report("end to end: term index", indexed_ms, full_ms, f"mismatches {mismatches}")
+
+
+def bench_batch(n_products, n_queries, top_n, batch_size):
+    catalog, model = build_model(n_products)
+    queries = make_queries(catalog, n_queries)
+    batches = [queries[i:i + batch_size] for i in range(0, len(queries), batch_size)]
+
+    single, single_ms = time_queries(lambda q: model.get_recommendations(q, top_n=top_n), queries)
+    batched, batch_ms = time_queries(lambda qs: model.get_recommendations_batch(qs, top_n=top_n), batches)
+    # Amortized cost: each batch's latency spread over its queries
+    per_query_ms = np.repeat(batch_ms / [len(b) for b in batches], [len(b) for b in batches])
+    mismatches = sum(a != b for a, b in zip(single, [recs for result in batched for recs in result]))
+    report("hybrid: single calls", single_ms)
+    report(f"hybrid: batches of {batch_size}", per_query_ms, single_ms, f"mismatches {mismatches}")
+
+
+def bench_memory(n_products):
+    catalog = make_large_catalog(n_products)
+    model = ml_module.AmazonProductRecommender(product_data=to_products_table(catalog), compact=False)
+    per_million = 1e6 / len(model.product_data)
+    columns = model.product_data.memory_usage(deep=True)
+    before, after = model.compact_product_data()
+    print(f"\nproduct_data memory per million products")
+    print(f"{'before':<10} {before * per_million / 2**20:8.1f} MB  ({len(columns) - 1} columns)")
+    print(f"{'after':<10} {after * per_million / 2**20:8.1f} MB  ({len(model.product_data.columns)} columns)")
+    compact = model.product_data.memory_usage(deep=True)
+    for col in columns.index[1:]:
+        after_col = f"{compact[col] * per_million / 2**20:8.1f} MB" if col in compact else "  dropped"
+        print(f"  {col:<18} {columns[col] * per_million / 2**20:8.1f} MB -> {after_col}")
+
+
+# Modules whose import bench_imports reports, because loading them is slow
+HEAVY_MODULES = ["sklearn", "torch", "whisper"]
+
+
+def bench_imports(modules, repeats):
+    """Wall time for a fresh interpreter to import each module (median over repeats)"""
+    def import_time(module):
+        # The module may print while importing; the measurement is the last line
+        code = f"import sys, time; start = time.perf_counter(); import {module}; " \
+               f"print(time.perf_counter() - start, *sorted(set({HEAVY_MODULES!r}) & set(sys.modules)))"
+        times, loaded = [], []
+        for _ in range(repeats):
+            out = subprocess.run([sys.executable, "-W", "ignore", "-c", code],
+                                 capture_output=True, text=True, check=True).stdout.splitlines()[-1].split()
+            times.append(float(out[0]) * 1000)
+            loaded = out[1:]
+        return np.median(times), " ".join(loaded)
+
+    print(f"{'module':<16} {'import':>10}  heavy modules loaded")
+    for module in modules:
+        ms, loaded = import_time(module)
+        print(f"{module:<16} {ms:7.0f} ms  {loaded or '-'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recommender benchmarks")
+    parser.add_argument("benchmark", choices=["ann", "terms", "batch", "memory", "imports"])
+    parser.add_argument("--products", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--modules", nargs="+", default=["ml_module", "recommendor", "transcribe", "main"])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.benchmark == "ann":
+        bench_ann(args.products, args.queries, args.top_n, args.probes)
+    elif args.benchmark == "terms":
+        bench_terms(args.products, args.queries, args.top_n)
+    elif args.benchmark == "batch":
+        bench_batch(args.products, args.queries, args.top_n, args.batch_size)
+    elif args.benchmark == "memory":
+        bench_memory(args.products)
+    elif args.benchmark == "imports":
+        bench_imports(args.modules, args.repeats)
@@ -0,0 +1,265 @@
+"""
+Columnar binary snapshot of the cleaned product catalog.
+
+Each column is stored on its own so it can be memory-mapped instead of parsed:
+
+    <snapshot_dir>/
+        manifest.json        # row count and the kind/dtype of every column
+        <col>.bin            # numeric column: raw little-endian values
+        <col>__offsets.bin   # text column: int64 offsets, rows + 1 of them
+        <col>__bytes.bin     # text column: UTF-8 bytes of all values back to back
+
+Opening a snapshot costs no parsing, pages are read only when touched, and
+every process that maps the same files shares them through the page cache.
+Model artifact builds store their product columns in the same layout (as
+.npy arrays, see ml_module.save_artifacts).
+"""
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+
+class StringColumn:
+    """Read-only text column over an offsets array and a UTF-8 byte buffer"""
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, positions):
+        offsets, data = self.offsets, self.data
+        return [bytes(data[offsets[i]:offsets[i + 1]]).decode("utf-8") for i in positions]
+
+    def to_numpy(self):
+        text = bytes(self.data).decode("utf-8") if len(self.data) else ""
+        # Offsets are byte positions; decode once and slice by characters only for ASCII data
+        if len(text) == len(self.data):
+            offsets = self.offsets.tolist()
+            return np.array([text[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])], dtype=object)
+        return np.array(self[range(len(self))], dtype=object)
+
+    @classmethod
+    def encode(cls, values):
+        """Text values (missing ones become '') -> StringColumn held in memory"""
+        encoded = [value.encode("utf-8") if isinstance(value, str) else b"" for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+        return cls(offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+
+def is_numeric(series):
+    return pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype)
+
+
+def numeric_array(series):
+    """Numeric Series -> NumPy array; integers with missing values become a masked array"""
+    if pd.api.types.is_integer_dtype(series.dtype) and series.isna().any():
+        return np.ma.MaskedArray(series.fillna(0).to_numpy(np.int64), mask=series.isna().to_numpy())
+    return series.to_numpy()
+
+
+def python_values(array):
+    """
+    Array -> list of Python scalars; float32 values come back as their shortest
+    decimal (68.74, not 68.7399978), masked values as None
+    """
+    if array.dtype == np.float32:
+        return array.astype(str).astype(np.float64).tolist()
+    return array.tolist()
+
+
+class ProductTable:
+    """
+    Read-only columnar product table: numeric columns are NumPy arrays
+    (possibly memory-mapped), text columns are StringColumns.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    @classmethod
+    def from_frame(cls, frame):
+        columns = {}
+        for name in frame.columns:
+            series = frame[name]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                # Stored by value; the dtype follows the categories (e.g. int64 category ids),
+                # and integer categories stay integers when some rows have none
+                if pd.api.types.is_integer_dtype(series.cat.categories.dtype):
+                    series = series.astype("Int64")
+                else:
+                    series = pd.Series(np.asarray(series)).infer_objects()
+            if is_numeric(series):
+                columns[name] = numeric_array(series)
+            else:
+                columns[name] = StringColumn.encode(series.tolist())
+        return cls(columns)
+
+    def to_arrays(self, prefix=""):
+        """Flatten into name -> np.ndarray, e.g. for model_store.write_artifacts"""
+        arrays = {}
+        for name, column in self.columns.items():
+            if isinstance(column, StringColumn):
+                arrays[f"{prefix}{name}__offsets"] = column.offsets
+                arrays[f"{prefix}{name}__bytes"] = column.data
+            elif isinstance(column, np.ma.MaskedArray):
+                arrays[f"{prefix}{name}"] = column.data
+                arrays[f"{prefix}{name}__mask"] = np.ma.getmaskarray(column)
+            else:
+                arrays[f"{prefix}{name}"] = column
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix=""):
+        columns = {}
+        for key, array in arrays.items():
+            if not key.startswith(prefix):
+                continue
+            name = key[len(prefix):]
+            if name.endswith("__offsets"):
+                name = name[:-len("__offsets")]
+                columns[name] = StringColumn(array, arrays[f"{prefix}{name}__bytes"])
+            elif f"{prefix}{name}__mask" in arrays:
+                columns[name] = np.ma.MaskedArray(array, mask=arrays[f"{prefix}{name}__mask"])
+            elif not name.endswith(("__bytes", "__mask")):
+                columns[name] = array
+        return cls(columns)
+
+    def records(self, positions, columns):
+        """List of {column: value} dicts for the given row positions, like DataFrame.to_dict('records')"""
+        positions = np.asarray(positions)
+        values = []
+        for name in columns:
+            column = self.columns[name]
+            values.append(column[positions] if isinstance(column, StringColumn) else python_values(column[positions]))
+        return [dict(zip(columns, row)) for row in zip(*values)]
+
+    def to_frame(self, columns=None, start=0, stop=None):
+        """Materialize (a row range of) the table as a DataFrame"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        data = {}
+        for name in columns or self.columns:
+            column = self.columns[name]
+            if isinstance(column, StringColumn):
+                data[name] = StringColumn(column.offsets[start:stop + 1] - column.offsets[start],
+                                          column.data[column.offsets[start]:column.offsets[stop]]).to_numpy()
+            elif isinstance(column, np.ma.MaskedArray):
+                data[name] = pd.arrays.IntegerArray(np.array(column.data[start:stop]),
+                                                    np.array(np.ma.getmaskarray(column)[start:stop]))
+            else:
+                data[name] = np.array(column[start:stop])
+        return pd.DataFrame(data)
+
+    def iter_frames(self, chunk_size):
+        for start in range(0, len(self), chunk_size):
+            yield self.to_frame(start=start, stop=start + chunk_size)
+
+
+class SnapshotWriter:
+    """
+    Append DataFrame chunks to a new snapshot; the first chunk fixes the columns
+    and their types. The snapshot replaces any previous one only on close().
+    """
+
+    def __init__(self, snapshot_dir):
+        self.snapshot_dir = snapshot_dir
+        self.tmp_dir = f"{snapshot_dir.rstrip(os.sep)}.tmp-{uuid.uuid4().hex[:8]}"
+        os.makedirs(self.tmp_dir)
+        self.kinds = None
+        self.files = {}
+        self.text_sizes = {}
+        self.rows = 0
+
+    def _open(self, name):
+        return open(os.path.join(self.tmp_dir, f"{name}.bin"), "wb")
+
+    def append(self, chunk):
+        if self.kinds is None:
+            self.kinds = {}
+            for name in chunk.columns:
+                if is_numeric(chunk[name]):
+                    self.kinds[name] = {"kind": "numeric", "dtype": chunk[name].to_numpy().dtype.newbyteorder("<").str}
+                    self.files[name] = self._open(name)
+                else:
+                    self.kinds[name] = {"kind": "text"}
+                    self.files[f"{name}__offsets"] = self._open(f"{name}__offsets")
+                    self.files[f"{name}__bytes"] = self._open(f"{name}__bytes")
+                    self.files[f"{name}__offsets"].write(np.zeros(1, dtype="<i8").tobytes())
+                    self.text_sizes[name] = 0
+
+        for name, kind in self.kinds.items():
+            if kind["kind"] == "numeric":
+                self.files[name].write(chunk[name].to_numpy().astype(kind["dtype"]).tobytes())
+            else:
+                column = StringColumn.encode(chunk[name].tolist())
+                self.files[f"{name}__offsets"].write((column.offsets[1:] + self.text_sizes[name]).astype("<i8").tobytes())
+                self.files[f"{name}__bytes"].write(column.data.tobytes())
+                self.text_sizes[name] += len(column.data)
+        self.rows += len(chunk)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        with open(os.path.join(self.tmp_dir, "manifest.json"), "w") as f:
+            json.dump({"rows": self.rows, "columns": self.kinds or {}}, f, indent=2)
+        # Swap the finished snapshot into place
+        old_dir = None
+        if os.path.exists(self.snapshot_dir):
+            old_dir = f"{self.snapshot_dir.rstrip(os.sep)}.old-{uuid.uuid4().hex[:8]}"
+            os.replace(self.snapshot_dir, old_dir)
+        os.replace(self.tmp_dir, self.snapshot_dir)
+        if old_dir:
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+    def abort(self):
+        """Discard the snapshot being written; any previous one stays in place"""
+        for f in self.files.values():
+            f.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def write_snapshot(frames, snapshot_dir):
+    """Write an iterable of DataFrame chunks as a snapshot; returns the row count"""
+    writer = SnapshotWriter(snapshot_dir)
+    try:
+        for frame in frames:
+            writer.append(frame)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    return writer.rows
+
+
+def read_snapshot(snapshot_dir):
+    """Open a snapshot with every column memory-mapped read-only"""
+    with open(os.path.join(snapshot_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    rows = manifest["rows"]
+
+    def mapped(name, dtype, length):
+        if length == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(os.path.join(snapshot_dir, f"{name}.bin"), dtype=dtype, mode="r", shape=(length,))
+
+    columns = {}
+    for name, kind in manifest["columns"].items():
+        if kind["kind"] == "numeric":
+            columns[name] = mapped(name, kind["dtype"], rows)
+        else:
+            offsets = mapped(f"{name}__offsets", "<i8", rows + 1)
+            columns[name] = StringColumn(offsets, mapped(f"{name}__bytes", np.uint8, int(offsets[-1])))
+    return ProductTable(columns)
@@ -1,31 +1,129 @@
+import argparse
+import numpy as np
 import pandas as pd
+from catalog_snapshot import SnapshotWriter
 
-# Step 1: Read the CSV file
-file_path = "merged_with_category.csv"  # Change this to your actual file path
-df = pd.read_csv(file_path)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet output is optional
+    pa = None
 
-# Step 2: Remove duplicate rows
-df = df.drop_duplicates()
+# Explicit dtypes for the known columns, so every chunk parses the same way;
+# nullable integers keep missing values until they are filled
+COLUMN_DTYPES = {
+    "asin": "string",
+    "title": "string",
+    "imgUrl": "string",
+    "productURL": "string",
+    "stars": "float64",
+    "reviews": "Int64",
+    "price": "float64",
+    "listPrice": "float64",
+    "category_id": "Int64",
+    "isBestSeller": "boolean",
+    "boughtInLastMonth": "Int64",
+    "category_name": "string",
+}
+CHUNK_SIZE = 100000
 
-# Step 3: Replace missing numbers with 0.0 and missing strings with ""
-df = df.fillna({col: 0.0 if df[col].dtype in ['int64', 'float64'] else "" for col in df.columns})
+def fill_missing(chunk):
+    # Replace missing numbers with 0.0 and missing strings with ""
+    for col in chunk.columns:
+        if pd.api.types.is_bool_dtype(chunk[col].dtype):
+            chunk[col] = chunk[col].fillna(False).astype(bool)
+        elif pd.api.types.is_integer_dtype(chunk[col].dtype):
+            chunk[col] = chunk[col].fillna(0).astype("int64")
+        elif pd.api.types.is_numeric_dtype(chunk[col].dtype):
+            chunk[col] = chunk[col].fillna(0.0)
+        else:
+            chunk[col] = chunk[col].fillna("").astype(str)
+    return chunk
 
+def clean_catalog(file_path, output_file, parquet_file=None, key=None, chunk_size=CHUNK_SIZE, snapshot_dir=None):
+    """
+    Stream the raw CSV in chunks: drop duplicates, fill missing values and
+    append each chunk to the cleaned CSV (and Parquet file), so memory stays
+    bounded by one chunk plus one 64-bit hash per distinct row.
+    Args:
+        file_path (str): Raw merged CSV
+        output_file (str): Cleaned CSV to write
+        parquet_file (str): Also write this Parquet file (needs pyarrow)
+        key (str): Deduplicate on this column (e.g. 'asin') instead of whole rows
+        chunk_size (int): Rows per chunk
+        snapshot_dir (str): Also write the columnar catalog snapshot read by
+            setup_database.py and ml_module
+    Returns:
+        dict: Rows read, duplicates dropped and rows written
+    """
+    if parquet_file and pa is None:
+        print("⚠️ Warning: pyarrow is not installed, skipping the Parquet output.")
+        parquet_file = None
 
-# Check if there are any missing values in the DataFrame
-missing_values = df.isnull().sum().sum()
+    seen = set()
+    stats = {"rows_read": 0, "duplicates": 0, "rows_written": 0}
+    writer = None
+    snapshot = SnapshotWriter(snapshot_dir) if snapshot_dir else None
+    header = True
+    try:
+        # Step 1: Read the CSV file in chunks
+        for chunk in pd.read_csv(file_path, chunksize=chunk_size, dtype=COLUMN_DTYPES):
+            stats["rows_read"] += len(chunk)
 
-if missing_values == 0:
-    print("✅ No missing values found in the dataset.")
-else:
-    print(f"⚠️ Warning: {missing_values} missing values still exist.")
+            # Step 2: Remove duplicate rows, across chunks, by hashing the key or the whole row
+            hashes = pd.util.hash_pandas_object(chunk[key] if key else chunk, index=False)
+            keep = ~hashes.duplicated().to_numpy()
+            keep &= np.fromiter((h not in seen for h in hashes.tolist()), dtype=bool, count=len(hashes))
+            seen.update(hashes[keep].tolist())
+            stats["duplicates"] += int(len(chunk) - keep.sum())
+            chunk = chunk[keep].copy()
 
+            # Step 3: Replace missing numbers with 0.0 and missing strings with ""
+            chunk = fill_missing(chunk)
 
-# Define the output file name
-output_file = "erged_with_category_cleaned.csv"
+            # Check if there are any missing values in the chunk
+            missing_values = chunk.isnull().sum().sum()
+            if missing_values:
+                print(f"⚠️ Warning: {missing_values} missing values still exist.")
 
-# Save the cleaned DataFrame to a new CSV file
-df.to_csv(output_file, index=False)
+            # Step 4: Append the chunk to the outputs
+            chunk.to_csv(output_file, mode="w" if header else "a", header=header, index=False)
+            header = False
+            if parquet_file:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(parquet_file, table.schema)
+                writer.write_table(table.cast(writer.schema))
+            if snapshot is not None:
+                snapshot.append(chunk)
+            stats["rows_written"] += len(chunk)
+            print(f"  {stats['rows_read']} rows read, {stats['rows_written']} written")
+    except BaseException:
+        # Leave no half-written snapshot behind; a previous one stays in place
+        if snapshot is not None:
+            snapshot.abort()
+        raise
 
-print(f"✅ Cleaned data has been saved to '{output_file}'.")
+    if writer is not None:
+        writer.close()
+    if snapshot is not None:
+        snapshot.close()
+    return stats
 
-print(df.info())
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean the merged product CSV")
+    parser.add_argument("--input", default="merged_with_category.csv")  # Change this to your actual file path
+    parser.add_argument("--output", default="merged_with_category_cleaned.csv")
+    parser.add_argument("--parquet", default="merged_with_category_cleaned.parquet",
+                        help="Columnar copy of the output ('' to skip)")
+    parser.add_argument("--snapshot", default="merged_with_category_cleaned.snapshot",
+                        help="Columnar catalog snapshot directory ('' to skip)")
+    parser.add_argument("--key", default=None, help="Deduplicate on this column (e.g. asin) instead of whole rows")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    stats = clean_catalog(args.input, args.output, args.parquet or None, args.key, args.chunk_size,
+                          args.snapshot or None)
+    print(f"✅ Cleaned data has been saved to '{args.output}'.")
+    print(f"Rows read: {stats['rows_read']}, duplicates dropped: {stats['duplicates']}, "
+          f"rows written: {stats['rows_written']}")
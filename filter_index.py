@@ -0,0 +1,106 @@
+"""
+Precomputed product filters for recommendation queries.
+
+The fixed constraints a query can ask for ("bestseller", "highly rated", a
+category) are stored as packed bitsets, one bit per product, so combining them
+is a bitwise AND over n/8 bytes and testing a candidate is a single bit lookup.
+Price ranges are answered from the products sorted by price: a range is one
+pair of binary searches instead of two comparisons per product.
+"""
+import numpy as np
+
+# Products at or below this quantile of sales_rank count as bestsellers
+BESTSELLER_QUANTILE = 0.2
+MIN_RATING = 4.0
+
+
+class FilterIndex:
+    def fit(self, price, sales_rank=None, rating=None, category_codes=None, n_categories=0):
+        """
+        Args:
+            price (np.ndarray): Price per product (NaN never matches a range)
+            sales_rank (np.ndarray): Lower is more popular
+            rating (np.ndarray): Star rating per product
+            category_codes (np.ndarray): Category code per product (-1 for none)
+            n_categories (int): Number of category codes
+        """
+        self.price_order = np.argsort(price, kind='stable')
+        self.price_sorted = price[self.price_order]
+        self.bitsets = {}
+        if sales_rank is not None:
+            self.sales_threshold = np.array([np.nanquantile(sales_rank, BESTSELLER_QUANTILE)])
+            self.bitsets['bestseller'] = np.packbits(sales_rank <= self.sales_threshold[0])
+        if rating is not None:
+            self.bitsets['highly_rated'] = np.packbits(rating >= MIN_RATING)
+        if category_codes is not None and n_categories > 0:
+            # One row of bits per category, filled in a single pass over the products
+            categories = np.zeros((n_categories, (len(price) + 7) // 8), dtype=np.uint8)
+            positions = np.flatnonzero(category_codes >= 0)
+            np.bitwise_or.at(categories, (category_codes[positions], positions >> 3),
+                             (np.uint8(0x80) >> (positions & 7).astype(np.uint8)))
+            self.bitsets['categories'] = categories
+        self._combined = {}
+        print(f"Filter index built with bitsets {sorted(self.bitsets)} over {len(price)} products")
+        return self
+
+    @property
+    def n_products(self):
+        return len(self.price_order)
+
+    def has(self, name):
+        return name in self.bitsets
+
+    def combined(self, names):
+        """AND of the named bitsets (cached per combination), or None for no constraint"""
+        names = tuple(sorted(names))
+        if not names:
+            return None
+        if names not in self._combined:
+            bits = self.bitsets[names[0]].copy()
+            for name in names[1:]:
+                bits &= self.bitsets[name]
+            self._combined[names] = bits
+        return self._combined[names]
+
+    def category(self, code):
+        return self.bitsets['categories'][code]
+
+    def contains(self, bits, positions):
+        """Bool mask of which positions (an index array, or slice(None) for all) have their bit set"""
+        if isinstance(positions, slice):
+            return np.unpackbits(bits, count=self.n_products).astype(bool)
+        return (bits[positions >> 3] & (np.uint8(0x80) >> (positions & 7).astype(np.uint8))) != 0
+
+    def price_mask(self, min_price, max_price):
+        """Bool mask over all products with min_price <= price <= max_price"""
+        lo = np.searchsorted(self.price_sorted, min_price, side='left')
+        hi = np.searchsorted(self.price_sorted, max_price, side='right')
+        # Mark whichever side is smaller: the products in range or the ones outside it
+        if hi - lo <= self.n_products // 2:
+            mask = np.zeros(self.n_products, dtype=bool)
+            mask[self.price_order[lo:hi]] = True
+        else:
+            mask = np.ones(self.n_products, dtype=bool)
+            mask[self.price_order[:lo]] = False
+            mask[self.price_order[hi:]] = False
+        return mask
+
+    def to_arrays(self):
+        arrays = {'price_order': self.price_order, 'price_sorted': self.price_sorted}
+        for name, bits in self.bitsets.items():
+            arrays[f'bits_{name}'] = bits
+        if hasattr(self, 'sales_threshold'):
+            arrays['sales_threshold'] = self.sales_threshold
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        self = cls()
+        self.bitsets = {}
+        for name, array in arrays.items():
+            if name.startswith('bits_'):
+                self.bitsets[name[len('bits_'):]] = array
+            else:
+                setattr(self, name, array)
+        self._combined = {}
+        return self
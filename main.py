@@ -1,8 +1,37 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
-from ml_module import get_recommendations  # Import ML function
+from ml_module import (  # Import ML functions
+    get_recommendations, get_recommendations_batch, get_recommender, recommendation_cache_key, result_cache,
+)
+from transcribe import SAMPLE_RATE, AudioStream, decode_audio, transcription_pool
+from worker_pool import Overloaded, ScoringPool
 
-app = FastAPI()
+# Bounded pool that runs the CPU-heavy scoring off the event loop
+# (configured with RECOMMEND_EXECUTOR / RECOMMEND_WORKERS / RECOMMEND_MAX_QUEUE / RECOMMEND_TIMEOUT_S)
+scoring_pool = ScoringPool.from_env()
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load the model before the pool starts, so forked scoring workers inherit it
+    get_recommender()
+    scoring_pool.start()
+    yield
+    scoring_pool.shutdown()
+    transcription_pool.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+MAX_BATCH_SIZE = 100
+MAX_AUDIO_BYTES = 10 * 2**20
+# Streaming voice queries: a partial transcript per STREAM_WINDOW_S seconds of new
+# audio, provisional recommendations from STREAM_MIN_WORDS recognized words on,
+# and audio beyond STREAM_MAX_S (one Whisper window) is not transcribed
+STREAM_WINDOW_S = 1.0
+STREAM_MIN_WORDS = 2
+STREAM_MAX_S = 30.0
 
 # Define input schema (all fields optional)
 class UserQuery(BaseModel):
@@ -19,16 +48,215 @@ def read_root():
     return {"message": "Welcome to the Product Recommendation API"}
 
 @app.post("/recommend")
-def recommend_products(query: UserQuery):
+async def recommend_products(query: UserQuery):
     query_params = {k: v for k, v in query.dict().items() if v is not None}
     
     if not query_params:
         raise HTTPException(status_code=400, detail="At least one query parameter is required")
     
-    # Get recommendations from ML model
-    recommendations = get_recommendations(query_params)
+    recommendations = await score_query(query_params)
     
     if not recommendations:
         raise HTTPException(status_code=404, detail="No products found matching your criteria")
     
     return {"recommendations": recommendations}
+
+async def score_query(query_params):
+    # Repeated queries are answered from the cache without touching the scoring pool
+    key = recommendation_cache_key(query_params)
+    recommendations = result_cache.get(key)
+    if recommendations is None:
+        # Get recommendations from ML model
+        try:
+            recommendations = await scoring_pool.run(get_recommendations, query_params, False)
+        except Overloaded as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        result_cache.put(key, recommendations)
+    return recommendations
+
+@app.post("/recommend/voice")
+async def recommend_products_voice(request: Request):
+    """Recommendations for a spoken query; the request body is the audio file (any format ffmpeg reads)"""
+    too_large = HTTPException(status_code=413, detail=f"Audio is larger than {MAX_AUDIO_BYTES} bytes")
+    # Refuse oversized uploads before reading them, and stop reading a body
+    # without a (truthful) Content-Length as soon as it passes the limit
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > MAX_AUDIO_BYTES:
+        raise too_large
+    audio = bytearray()
+    async for chunk in request.stream():
+        audio.extend(chunk)
+        if len(audio) > MAX_AUDIO_BYTES:
+            raise too_large
+    if not audio:
+        raise HTTPException(status_code=400, detail="The request body must contain the audio")
+
+    # Decoded in memory straight to the samples Whisper takes
+    try:
+        samples = await asyncio.to_thread(decode_audio, audio)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        result = await transcription_pool.run(samples)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+    transcript = result["text"].strip()
+    if not transcript:
+        raise HTTPException(status_code=422, detail="No speech recognized")
+    recommendations = await score_query({"keywords": transcript})
+    if not recommendations:
+        raise HTTPException(status_code=404, detail="No products found matching your criteria")
+    return {"transcript": transcript, "recommendations": recommendations}
+
+@app.websocket("/recommend/voice/stream")
+async def recommend_products_voice_stream(websocket: WebSocket):
+    """
+    Streaming voice query. The client sends the audio as binary messages while
+    it records (a container stream such as MediaRecorder's WebM/Opus, or raw
+    16 kHz mono 16-bit PCM after a first text message {"format": "pcm_s16le"})
+    and the text message "end" when done. The server answers with JSON messages:
+        {"type": "partial", "transcript": ..., "audio_s": ...}
+        {"type": "recommendations", "transcript": ..., "recommendations": [...]}  (provisional)
+        {"type": "final", "transcript": ..., "recommendations": [...]}
+        {"type": "error", "detail": ...}
+    and closes the connection after "final" or "error".
+    """
+    await websocket.accept()
+    stream = AudioStream()
+    received = asyncio.Event()
+
+    async def receive():
+        nonlocal stream
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes"):
+                stream.append(message["bytes"])
+                if len(stream) >= MAX_AUDIO_BYTES:
+                    return
+            elif message.get("text"):
+                if message["text"].strip() == "end":
+                    return
+                config = json.loads(message["text"])
+                if not isinstance(config, dict):
+                    raise ValueError("Text messages must be 'end' or a JSON object")
+                if config.get("format") == "pcm_s16le" and not len(stream):
+                    stream = AudioStream(pcm=True)
+            received.set()
+
+    receiver = asyncio.create_task(receive())
+    samples = None
+    transcript = None
+    transcribed_s = 0.0
+    decoded_at = None
+    scored = None
+    loop = asyncio.get_running_loop()
+    try:
+        # Transcribe the audio received so far whenever a window's worth is new
+        while not receiver.done():
+            waiter = asyncio.create_task(received.wait())
+            await asyncio.wait([waiter, receiver], return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            received.clear()
+            if receiver.done():
+                break
+            # A container stream is decoded again from the start each time, so
+            # at most once per window however small the client's chunks are
+            if decoded_at is not None and loop.time() - decoded_at < STREAM_WINDOW_S:
+                continue
+            decoded_at = loop.time()
+            try:
+                samples = await asyncio.to_thread(stream.samples)
+            except Exception:
+                continue  # Not decodable yet, e.g. the container header is incomplete
+            if len(samples) >= STREAM_MAX_S * SAMPLE_RATE:
+                break
+            if len(samples) / SAMPLE_RATE - transcribed_s < STREAM_WINDOW_S:
+                continue
+            try:
+                # Partials take one greedy pass, without the temperature fallbacks
+                result = await transcription_pool.run(samples, temperature=0.0)
+            except Overloaded:
+                continue  # Skip this partial; the final transcription still runs
+            transcribed_s = len(samples) / SAMPLE_RATE
+            transcript = result["text"].strip()
+            await websocket.send_json({"type": "partial", "transcript": transcript, "audio_s": transcribed_s})
+            if len(transcript.split()) >= STREAM_MIN_WORDS and transcript.lower() != scored:
+                scored = transcript.lower()
+                try:
+                    recommendations = await score_query({"keywords": transcript})
+                except HTTPException:
+                    continue  # Overloaded: no provisional results this time
+                await websocket.send_json(
+                    {"type": "recommendations", "transcript": transcript, "recommendations": recommendations})
+
+        if receiver.done():
+            receiver.result()  # Raises if the client went away or sent an invalid message
+        else:
+            receiver.cancel()
+        try:
+            samples = await asyncio.to_thread(stream.samples)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        samples = samples[:int(STREAM_MAX_S * SAMPLE_RATE)]
+        if transcript is None or len(samples) / SAMPLE_RATE > transcribed_s:
+            transcript = (await transcription_pool.run(samples))["text"].strip() if len(samples) else ""
+        recommendations = await score_query({"keywords": transcript}) if transcript else []
+        await websocket.send_json({"type": "final", "transcript": transcript, "recommendations": recommendations})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except (HTTPException, Overloaded, ValueError) as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        await websocket.send_json({"type": "error", "detail": detail})
+        # 1013 "try again later" when overloaded, 1003 for audio or messages that can't be used
+        overloaded = isinstance(e, Overloaded) or getattr(e, "status_code", None) == 503
+        await websocket.close(code=1013 if overloaded else 1003)
+    except Exception as e:
+        # E.g. the Whisper model failed to load
+        await websocket.send_json({"type": "error", "detail": f"Voice query failed: {e}"})
+        await websocket.close(code=1011)
+    finally:
+        receiver.cancel()
+
+@app.post("/recommend/batch")
+async def recommend_products_batch(queries: list[UserQuery]):
+    if not queries:
+        raise HTTPException(status_code=400, detail="At least one query is required")
+    if len(queries) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} queries per batch")
+
+    query_params_list = [{k: v for k, v in query.dict().items() if v is not None} for query in queries]
+    empty = [i for i, query_params in enumerate(query_params_list) if not query_params]
+    if empty:
+        raise HTTPException(status_code=400, detail=f"Queries {empty} have no query parameters")
+
+    keys = [recommendation_cache_key(query_params) for query_params in query_params_list]
+    results = [result_cache.get(key) for key in keys]
+    missing = [i for i, recommendations in enumerate(results) if recommendations is None]
+    if missing:
+        # One pool task scores all uncached queries with a single matrix product
+        try:
+            scored = await scoring_pool.run(
+                get_recommendations_batch, [query_params_list[i] for i in missing], False)
+        except Overloaded as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        for i, recommendations in zip(missing, scored):
+            results[i] = recommendations
+            result_cache.put(keys[i], recommendations)
+
+    return {"results": [{"recommendations": recommendations} for recommendations in results]}
+
+@app.get("/stats/pool")
+def pool_stats():
+    return scoring_pool.stats()
+
+@app.get("/stats/cache")
+def cache_stats():
+    return result_cache.stats()
+
+@app.get("/stats/transcription")
+def transcription_stats():
+    return transcription_pool.stats()
@@ -1,106 +1,621 @@
 import pandas as pd
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
 import re
 import sqlite3
+import argparse
+import copy
+import os
+import threading
+import time
+from scipy import sparse
+import model_store
+from catalog_snapshot import ProductTable, read_snapshot
+import query_db
+from ann_index import IVFIndex
+from term_index import InvertedIndex
+from filter_index import FilterIndex
+from result_cache import ResultCache
 
-class AmazonProductRecommender:
-    def __init__(self):
-        # Load data from SQLite
-        conn = sqlite3.connect("products.db")
-        self.product_data = pd.read_sql_query("SELECT * FROM products", conn)
-        conn.close()
+DB_PATH = "products.db"
+ARTIFACT_DIR = os.environ.get("MODEL_ARTIFACT_DIR", "model_artifacts")
+FEATURE_CHUNK_SIZE = 100000
+# Relative score boost for the most popular / well-rated products when a query asks for them
+POPULARITY_WEIGHT = 0.5
+QUALITY_WEIGHT = 0.5
+# Candidates the ANN index hands to exact re-scoring and filtering
+ANN_MIN_CANDIDATES = 2000
+ANN_CANDIDATE_FACTOR = 100
+RESULT_FIELDS = ['asin', 'title', 'category', 'price', 'rating', 'review_count', 'sales_rank', 'imgUrl', 'productURL']
+# Incremental updates keep the fitted vocabulary and clusters; refit once any of these is exceeded
+REFIT_INTERVAL_S = float(os.environ.get("MODEL_REFIT_INTERVAL_S", 7 * 24 * 3600))
+REFIT_MAX_CHANGED = 0.2         # fraction of the catalog upserted since the last fit
+REFIT_MAX_UNKNOWN_TOKENS = 0.2  # share of upserted text tokens missing from the fitted vocabulary
+REFIT_MIN_VOCAB_SAMPLE = 0.01   # fraction of the catalog upserted before that share is trusted
+# Catalogs this large are clustered with MiniBatchKMeans; rows per batch per CPU
+CLUSTER_MINIBATCH_MIN = int(os.environ.get("MODEL_CLUSTER_MINIBATCH_MIN", 100000))
+CLUSTER_BATCH_SIZE = 1024
+# How often a running process looks for a newly published build to reload
+MODEL_RELOAD_CHECK_S = float(os.environ.get("MODEL_RELOAD_CHECK_S", 10))
+
+# scikit-learn is imported where the models are fitted (loading artifacts imports it
+# through pickle), and the recommender singleton is loaded on first use (see
+# get_recommender), so importing this module does neither.
+
+def prepare_product_data(product_data):
+    """Rows in the products table schema -> the column names and scales the model uses"""
+    # Map database columns to ML expected columns
+    product_data = product_data.rename(columns={
+        "stars": "rating",
+        "reviews": "review_count",
+        "category_id": "category",  # Assuming category_id acts as category
+        "boughtInLastMonth": "sales_rank"  # Proxy for sales_rank
+    })
+
+    # Products without a category come back from SQLite as NaN, which would turn
+    # every category id into a float; keep them integers, with <NA> for the missing
+    if "category" in product_data.columns and pd.api.types.is_float_dtype(product_data["category"].dtype):
+        category = product_data["category"]
+        if (category.dropna() % 1 == 0).all():
+            product_data["category"] = category.astype("Int64")
+
+    # Invert sales_rank (higher boughtInLastMonth = better)
+    if "sales_rank" in product_data.columns:
+        product_data["sales_rank"] = 1000000 / (product_data["sales_rank"] + 1)
+    return product_data
+
+def top_n_indices(candidate_scores, candidates, top_n):
+    """
+    Select the top_n candidates by descending score in O(len(candidates)).
+    Ties are broken by ascending position, matching a stable sort of the
+    candidates, so the result is identical to sorting them all.
+    Args:
+        candidate_scores (np.ndarray): Score of each candidate
+        candidates (np.ndarray): Ascending product positions allowed by the filters
+        top_n (int): Number of positions to return
+    Returns:
+        np.ndarray: Product positions, best first
+    """
+    if top_n <= 0 or len(candidates) == 0:
+        return np.empty(0, dtype=np.intp)
+    if len(candidates) > top_n:
+        part = np.argpartition(-candidate_scores, top_n - 1)[:top_n]
+        kth = candidate_scores[part].min()
+        above = np.flatnonzero(candidate_scores > kth)
+        ties = np.flatnonzero(candidate_scores == kth)[:top_n - len(above)]
+        keep = np.concatenate([above, ties])
+        candidates = candidates[keep]
+        candidate_scores = candidate_scores[keep]
+    order = np.lexsort((candidates, -candidate_scores))
+    return candidates[order]
+
+def first_matching(positions, accept, limit, block_size=256):
+    """
+    The first `limit` positions, in order, for which accept(positions) is True.
+    Scans in doubling blocks, so a selective filter still stops early.
+    """
+    found = []
+    n_found = 0
+    start = 0
+    while start < len(positions) and n_found < limit:
+        block = positions[start:start + block_size]
+        hits = block[accept(block)]
+        found.append(hits)
+        n_found += len(hits)
+        start += block_size
+        block_size *= 2
+    if not found:
+        return np.empty(0, dtype=np.intp)
+    return np.concatenate(found)[:limit]
 
-        # Map database columns to ML expected columns
-        self.product_data = self.product_data.rename(columns={
-            "stars": "rating",
-            "reviews": "review_count",
-            "category_id": "category",  # Assuming category_id acts as category
-            "boughtInLastMonth": "sales_rank"  # Proxy for sales_rank
-        })
+class AmazonProductRecommender:
+    # Columns kept in the persisted artifacts; everything else is only needed to train
+    artifact_columns = RESULT_FIELDS + ['cluster']
 
-        # Invert sales_rank (higher boughtInLastMonth = better)
-        if "sales_rank" in self.product_data.columns:
-            self.product_data["sales_rank"] = 1000000 / (self.product_data["sales_rank"] + 1)
+    def __init__(self, db_path=DB_PATH, product_data=None, compact=True, warm_start=None):
+        """
+        Args:
+            db_path (str): SQLite database with the products table
+            product_data (pd.DataFrame): Rows in the products table schema to
+                train on instead of reading the database (e.g. from a catalog
+                snapshot, or for benchmarks)
+            compact (bool): Shrink product_data to compact dtypes once trained
+            warm_start (AmazonProductRecommender): Previous model to start the
+                clustering from, so a refit of a changed catalog converges quickly
+        """
+        if product_data is None:
+            # Load data from SQLite
+            conn = sqlite3.connect(db_path)
+            self.product_data = pd.read_sql_query("SELECT * FROM products", conn)
+            conn.close()
+        else:
+            self.product_data = product_data.reset_index(drop=True)
+        self.product_data = prepare_product_data(self.product_data)
 
+        self.build_id = None
+        self.fit_info = {'fitted_at': time.time(), 'products': len(self.product_data)}
+        self.drift = {'changed_products': 0, 'tokens': 0, 'unknown_tokens': 0}
         self.cosine_model = None
         self.cluster_model = None
+        self.ann_index = None
+        self.ann_n_probe = 0
+        self.term_index = None
+        self.build_column_arrays()
         self.build_cosine_model()
-        self.build_cluster_model()
+        self.build_cluster_model(warm_start=warm_start)
+        self.build_filter_index()
+        if compact:
+            self.compact_product_data()
+
+    @classmethod
+    def from_artifacts(cls, artifact_dir=ARTIFACT_DIR, mmap=True):
+        """
+        Restore a trained recommender written by save_artifacts without touching
+        the database or refitting anything. Arrays are memory-mapped read-only.
+        """
+        loaded = model_store.read_artifacts(artifact_dir, mmap=mmap)
+        if loaded is None:
+            raise FileNotFoundError(f"No model artifacts found in '{artifact_dir}'")
+        manifest, arrays, objects = loaded
+
+        self = cls.__new__(cls)
+        # Records are served straight from the memory-mapped catalog columns; a
+        # DataFrame is only built if something (e.g. an update) asks for product_data
+        self.catalog = ProductTable.from_arrays(arrays, prefix='catalog_')
+        self._product_data = None
+        self.build_id = manifest['build_id']
+        self.fit_info = manifest.get('fit_info', {'fitted_at': manifest['built_at'], 'products': manifest['vectors_shape'][0]})
+        self.drift = manifest.get('drift', {'changed_products': 0, 'tokens': 0, 'unknown_tokens': 0})
+        self.column_arrays = {
+            name[len('column_'):]: array for name, array in arrays.items() if name.startswith('column_')
+        }
+        self.tfidf = objects['tfidf']
+        self.product_vectors = sparse.csr_matrix(
+            (arrays['vectors_data'], arrays['vectors_indices'], arrays['vectors_indptr']),
+            shape=tuple(manifest['vectors_shape']),
+            copy=False,
+        )
+        self.scaler = objects['scaler']
+        self.kmeans = objects['kmeans']
+        self.feature_columns = pd.Index(manifest['feature_columns'])
+        self.cluster_index = {
+            name[len('clusters_'):]: array for name, array in arrays.items() if name.startswith('clusters_')
+        }
+        self.category_names = objects['category_names']
+        self.filter_index = FilterIndex.from_arrays(
+            {name[len('filters_'):]: array for name, array in arrays.items() if name.startswith('filters_')})
+        self.build_query_matchers()
+        self.cosine_model = True
+        self.cluster_model = True
+        self.ann_index = None
+        self.ann_n_probe = 0
+        term_arrays = {name[len('terms_'):]: array for name, array in arrays.items() if name.startswith('terms_')}
+        self.term_index = InvertedIndex.from_arrays(term_arrays) if term_arrays else None
+        ann_arrays = {name[len('ann_'):]: array for name, array in arrays.items() if name.startswith('ann_')}
+        if ann_arrays:
+            self.ann_n_probe = manifest['ann_n_probe']
+            self.ann_index = IVFIndex.from_arrays(ann_arrays, n_probe=self.ann_n_probe)
+        print(f"Loaded model artifacts {self.build_id} ({self.product_vectors.shape[0]} products)")
+        return self
+
+    def save_artifacts(self, artifact_dir=ARTIFACT_DIR, db_path=DB_PATH):
+        """Persist everything needed to serve queries; returns the new build id"""
+        vectors = self.product_vectors.tocsr()
+        arrays = {
+            'vectors_data': vectors.data,
+            'vectors_indices': vectors.indices,
+            'vectors_indptr': vectors.indptr,
+        }
+        catalog = self.catalog
+        if catalog is None:
+            catalog = ProductTable.from_frame(self.product_data[
+                [col for col in self.artifact_columns if col in self.product_data.columns]
+            ])
+        arrays.update(catalog.to_arrays(prefix='catalog_'))
+        for name, array in self.column_arrays.items():
+            arrays[f'column_{name}'] = array
+        for name, array in self.cluster_index.items():
+            arrays[f'clusters_{name}'] = array
+        for name, array in self.filter_index.to_arrays().items():
+            arrays[f'filters_{name}'] = array
+        if self.term_index is not None:
+            for name, array in self.term_index.to_arrays().items():
+                arrays[f'terms_{name}'] = array
+        if self.ann_index is not None:
+            for name, array in self.ann_index.to_arrays().items():
+                arrays[f'ann_{name}'] = array
+
+        # The fitted attributes needed at query time only: the vectorizer's
+        # stop_words_ set and KMeans' per-sample labels_ can be large.
+        tfidf = copy.copy(self.tfidf)
+        if hasattr(tfidf, 'stop_words_'):
+            del tfidf.stop_words_
+        kmeans = copy.copy(self.kmeans)
+        if hasattr(kmeans, 'labels_'):
+            del kmeans.labels_
+        objects = {
+            'tfidf': tfidf,
+            'scaler': self.scaler,
+            'kmeans': kmeans,
+            'category_names': self.category_names,
+        }
+        metadata = {
+            'db': model_store.db_fingerprint(db_path),
+            'vectors_shape': list(vectors.shape),
+            'feature_columns': list(self.feature_columns),
+            'ann_n_probe': self.ann_n_probe,
+            'fit_info': self.fit_info,
+            'drift': self.drift,
+        }
+        self.build_id = model_store.write_artifacts(artifact_dir, arrays, objects, metadata)
+        print(f"Saved model artifacts {self.build_id} to '{artifact_dir}'")
+        return self.build_id
+
+    @property
+    def product_data(self):
+        if self._product_data is None and self.catalog is not None:
+            self._product_data = self.catalog.to_frame()
+        return self._product_data
+
+    @product_data.setter
+    def product_data(self, product_data):
+        # A new DataFrame supersedes the persisted catalog columns
+        self._product_data = product_data
+        self.catalog = None
+
+    def compact_product_data(self):
+        """
+        Shrink product_data to the columns serving and incremental updates read
+        (artifact_columns), with float32/int32 numbers, a categorical category and
+        int8/int16 cluster labels. Unused table columns are dropped; the feature
+        text and cluster features are never materialized. The float64
+        column_arrays used by the filters are kept.
+        Returns:
+            tuple: (bytes before, bytes after) by DataFrame.memory_usage(deep=True)
+        """
+        before = int(self.product_data.memory_usage(deep=True).sum())
+        data = self.product_data[[col for col in self.artifact_columns if col in self.product_data.columns]].copy()
+        for col in data.columns:
+            if col == 'cluster':
+                data[col] = data[col].astype(np.int8 if len(self.kmeans.cluster_centers_) <= 127 else np.int16)
+            elif col == 'category':
+                data[col] = data[col].astype('category')
+            elif pd.api.types.is_float_dtype(data[col].dtype):
+                data[col] = data[col].astype(np.float32)
+            elif pd.api.types.is_integer_dtype(data[col].dtype):
+                data[col] = data[col].astype(np.int32)
+        self.product_data = data
+        after = int(data.memory_usage(deep=True).sum())
+        print(f"product_data compacted from {before / 2**20:.1f} MB to {after / 2**20:.1f} MB")
+        return before, after
 
     def preprocess_text(self, text):
         if isinstance(text, str):
             return re.sub(r'[^\w\s]', '', text.lower())
         return ""
 
+    def build_column_arrays(self):
+        # Plain float arrays of the columns the request-time filters read, so a
+        # query is a few vectorized comparisons instead of per-row .iloc lookups
+        self.column_arrays = {}
+        for col in ['price', 'sales_rank', 'rating']:
+            if col in self.product_data.columns:
+                self.column_arrays[col] = self.product_data[col].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    def iter_feature_text(self, chunk_size=FEATURE_CHUNK_SIZE, product_data=None):
+        # Title + category text built with vectorized string ops one chunk at a
+        # time, so the vectorizer can stream it without a per-row Python loop
+        # or a full extra column of text held in memory
+        if product_data is None:
+            product_data = self.product_data
+        for start in range(0, len(product_data), chunk_size):
+            chunk = product_data.iloc[start:start + chunk_size]
+            text = chunk['title'].fillna('').astype(str)
+            if 'category' in chunk.columns:
+                # object first: a categorical category cannot be filled with ''
+                text = text + ' ' + chunk['category'].astype(object).fillna('').astype(str)
+            yield from text.str.lower().str.replace(r'[^\w\s]', '', regex=True)
+
+    def build_signal_arrays(self):
+        # Popularity and rating enter ranking as numeric boosts in [0, 1]
+        # instead of synthetic tokens appended to every product's text
+        n_products = len(self.product_data)
+        if 'sales_rank' in self.column_arrays:
+            sales_rank = self.column_arrays['sales_rank']
+            with np.errstate(invalid='ignore'):
+                level = np.clip(np.floor(1000000 / (sales_rank + 1000)), 1, 10)
+            self.column_arrays['popularity'] = np.where(sales_rank > 0, level / 10, 0.0)
+        else:
+            self.column_arrays['popularity'] = np.zeros(n_products)
+        if 'rating' in self.column_arrays and 'review_count' in self.product_data.columns:
+            review_count = self.product_data['review_count'].to_numpy(dtype=np.float64, na_value=np.nan)
+            self.column_arrays['quality'] = ((self.column_arrays['rating'] > 4.0) & (review_count > 50)).astype(np.float64)
+        else:
+            self.column_arrays['quality'] = np.zeros(n_products)
+
     def build_cosine_model(self):
-        text_features = []
-        for _, row in self.product_data.iterrows():
-            feature_text = f"{row.get('title', '')} {row.get('category', '')}"
-            if 'sales_rank' in self.product_data.columns:
-                sales_rank = row.get('sales_rank', 0)
-                if sales_rank > 0:
-                    popularity_level = min(10, max(1, int(1000000 / (sales_rank + 1000))))
-                    feature_text += f" {'bestseller' * popularity_level}"
-            if 'rating' in self.product_data.columns and 'review_count' in self.product_data.columns:
-                rating = row.get('rating', 0)
-                review_count = row.get('review_count', 0)
-                if rating > 4.0 and review_count > 50:
-                    feature_text += " highly rated well reviewed popular recommended"
-            text_features.append(feature_text)
-
-        self.product_data['combined_features'] = text_features
-        self.product_data['combined_features'] = self.product_data['combined_features'].apply(self.preprocess_text)
+        from sklearn.feature_extraction.text import TfidfVectorizer
 
+        self.build_signal_arrays()
         self.tfidf = TfidfVectorizer(stop_words='english')
-        self.product_vectors = self.tfidf.fit_transform(self.product_data['combined_features'])
+        self.product_vectors = self.tfidf.fit_transform(self.iter_feature_text())
+        self.term_index = InvertedIndex().fit(self.product_vectors)
         print(f"Cosine similarity model built with {self.product_vectors.shape[0]} products")
         self.cosine_model = True
 
-    def build_cluster_model(self, n_clusters=15):
+    def build_ann_index(self, n_components=64, n_lists=None, n_probe=8):
+        """
+        Build the optional approximate retrieval stage for cosine queries.
+        n_probe is the default recall-vs-latency setting; it can be overridden
+        per call through get_recommendations_cosine(n_probe=...).
+        """
+        if not self.cosine_model:
+            self.build_cosine_model()
+        self.ann_index = IVFIndex(n_components=n_components, n_lists=n_lists, n_probe=n_probe).fit(self.product_vectors)
+        self.ann_n_probe = n_probe
+
+    def build_cluster_model(self, n_clusters=15, minibatch=None, warm_start=None):
+        """
+        Fit the KMeans clusters over the numeric columns and one-hot top categories.
+        Args:
+            n_clusters (int): Number of clusters
+            minibatch (bool): Fit MiniBatchKMeans on batches of rows instead of
+                full KMeans (default: for catalogs of CLUSTER_MINIBATCH_MIN products or more)
+            warm_start (AmazonProductRecommender): Previous fit (e.g. before the
+                catalog changed) whose centroids the clustering starts from
+        """
+        from sklearn.cluster import KMeans, MiniBatchKMeans
+        from sklearn.preprocessing import StandardScaler
+
         numerical_features = ['price']
         if 'rating' in self.product_data.columns:
             numerical_features.append('rating')
         if 'review_count' in self.product_data.columns:
             numerical_features.append('review_count')
         if 'sales_rank' in self.product_data.columns:
-            self.product_data['sales_score'] = 1 / (self.product_data['sales_rank'] + 1)
             numerical_features.append('sales_score')
 
-        features = self.product_data[numerical_features].copy()
+        category_columns = []
         if 'category' in self.product_data.columns:
             top_categories = self.product_data['category'].value_counts().head(20).index
-            self.product_data['top_category'] = self.product_data['category'].apply(
-                lambda x: x if x in top_categories else 'Other'
-            )
-            category_dummies = pd.get_dummies(self.product_data['top_category'], prefix='category')
-            features = pd.concat([features, category_dummies], axis=1)
-
-        features = features.fillna(0)
-        self.scaler = StandardScaler()
+            top_category = self.product_data['category'].where(self.product_data['category'].isin(top_categories), 'Other')
+            # Same columns, in the same order, as pd.get_dummies(top_category, prefix='category')
+            category_columns = list(pd.get_dummies(pd.Series(top_category.unique()), prefix='category').columns)
+        self.feature_columns = pd.Index(numerical_features + category_columns)
+
+        # Sparse features and no centering, so the one-hot columns stay sparse;
+        # KMeans distances don't depend on the offset, only on the scale
+        features = self.cluster_features(self.product_data)
+        self.scaler = StandardScaler(with_mean=False)
         scaled_features = self.scaler.fit_transform(features)
 
-        self.kmeans = KMeans(n_clusters=n_clusters, random_state=42)
+        if minibatch is None:
+            minibatch = len(self.product_data) >= CLUSTER_MINIBATCH_MIN
+        init_centers = None
+        if warm_start is not None and len(warm_start.kmeans.cluster_centers_) == n_clusters:
+            init_centers = self.warm_start_centers(warm_start)
+        init = 'k-means++' if init_centers is None else init_centers
+        n_init = 'auto' if init_centers is None else 1
+        start = time.perf_counter()
+        if minibatch:
+            # sklearn's KMeans threads split each batch over the cores, so batches grow with them
+            self.kmeans = MiniBatchKMeans(n_clusters=n_clusters, init=init, n_init=n_init, random_state=42,
+                                          batch_size=CLUSTER_BATCH_SIZE * (os.cpu_count() or 1))
+        else:
+            self.kmeans = KMeans(n_clusters=n_clusters, init=init, n_init=n_init, random_state=42)
         self.product_data['cluster'] = self.kmeans.fit_predict(scaled_features)
-        self.feature_columns = features.columns
-        print(f"Cluster model built with {n_clusters} clusters")
+        self.build_cluster_index()
+        print(f"Cluster model built with {n_clusters} clusters in {time.perf_counter() - start:.1f}s "
+              f"({'mini-batch' if minibatch else 'full'}{', warm start' if init_centers is not None else ''})")
         self.cluster_model = True
 
-    def get_recommendations_cosine(self, query, top_n=5):
-        if not self.cosine_model:
-            self.build_cosine_model()
+    def cluster_features(self, rows):
+        """Sparse, unscaled cluster features (one column per feature_columns entry) for prepared product rows"""
+        n_numeric = sum(not col.startswith('category_') for col in self.feature_columns)
+        numeric = np.zeros((len(rows), n_numeric))
+        for i, col in enumerate(self.feature_columns[:n_numeric]):
+            if col == 'sales_score' and 'sales_rank' in rows.columns:
+                numeric[:, i] = 1 / (rows['sales_rank'].to_numpy(dtype=np.float64) + 1)
+            elif col in rows.columns:
+                numeric[:, i] = rows[col].to_numpy(dtype=np.float64)
+        numeric[np.isnan(numeric)] = 0
+        features = sparse.csr_matrix(numeric)
+        if n_numeric < len(self.feature_columns):
+            one_hot = sparse.csr_matrix((len(rows), len(self.feature_columns) - n_numeric))
+            if 'category' in rows.columns:
+                # Categories outside the fitted top categories count as 'Other'
+                dummies = 'category_' + rows['category'].astype(str)
+                dummies = dummies.where(dummies.isin(self.feature_columns), 'category_Other')
+                columns = self.feature_columns.get_indexer(dummies) - n_numeric
+                found = np.flatnonzero(columns >= 0)
+                one_hot = sparse.csr_matrix((np.ones(len(found)), (found, columns[found])), shape=one_hot.shape)
+            features = sparse.hstack([features, one_hot], format='csr')
+        return features
+
+    def warm_start_centers(self, previous):
+        """
+        Centroids of a previously fitted recommender, mapped into this model's
+        feature columns and scaling, to seed build_cluster_model after the catalog
+        changed. Categories the previous fit didn't have start at 0.
+        """
+        centers = pd.DataFrame(previous.scaler.inverse_transform(previous.kmeans.cluster_centers_),
+                               columns=previous.feature_columns)
+        centers = centers.reindex(columns=self.feature_columns, fill_value=0.0).to_numpy()
+        return self.scaler.transform(centers)
+
+    def build_cluster_index(self):
+        # Per-cluster product positions pre-sorted for every ordering the cluster
+        # path uses, in a CSR layout: cluster c owns order[offsets[c]:offsets[c + 1]]
+        labels = self.product_data['cluster'].to_numpy()
+        n_clusters = len(self.kmeans.cluster_centers_)
+        offsets = np.zeros(n_clusters + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=n_clusters), out=offsets[1:])
+        self.cluster_index = {
+            'offsets': offsets,
+            'by_position': np.argsort(labels, kind='stable'),
+        }
+        if 'sales_rank' in self.column_arrays:
+            self.cluster_index['by_sales_rank'] = np.lexsort((self.column_arrays['sales_rank'], labels))
+        if 'rating' in self.column_arrays:
+            self.cluster_index['by_rating'] = np.lexsort((-self.column_arrays['rating'], labels))
+        if 'category' in self.product_data.columns:
+            codes, names = pd.factorize(self.product_data['category'])
+            self.cluster_index['category_codes'] = codes.astype(np.int32)
+            self.category_names = list(names)
+        else:
+            self.category_names = []
+        self.build_query_matchers()
+
+    def assign_clusters(self, rows):
+        """Nearest existing KMeans cluster for prepared product rows, using the fitted features and scaler"""
+        return self.kmeans.predict(self.scaler.transform(self.cluster_features(rows)))
+
+    def upsert_products(self, products):
+        """
+        Add new products and replace changed ones (matched by asin) without refitting.
+        The TF-IDF vocabulary and IDF weights, the scaler and the KMeans centroids
+        stay fixed: rows are vectorized with the fitted vectorizer and assigned to
+        the nearest existing cluster. needs_refit() says when that has drifted too far.
+        Args:
+            products (pd.DataFrame): Rows in the products table schema
+        Returns:
+            tuple: (number of replaced products, number of added products)
+        """
+        rows = prepare_product_data(products).drop_duplicates('asin', keep='last').reset_index(drop=True)
+        if rows.empty:
+            return 0, 0
+        texts = list(self.iter_feature_text(product_data=rows))
+        vectors = self.tfidf.transform(texts)
+        rows['cluster'] = self.assign_clusters(rows)
+
+        # Replaced rows take the position of the first product with their asin;
+        # new rows are appended after the existing catalog
+        n_products = len(self.product_data)
+        known = pd.Series(np.arange(n_products), index=self.product_data['asin'].to_numpy())
+        known = known[~known.index.duplicated()]
+        existing = known.reindex(rows['asin'].to_numpy()).to_numpy()
+        is_new = np.isnan(existing)
+        order = np.arange(n_products)
+        order[existing[~is_new].astype(np.intp)] = n_products + np.flatnonzero(~is_new)
+        order = np.concatenate([order, n_products + np.flatnonzero(is_new)])
+        changed = np.where(is_new, n_products + np.cumsum(is_new) - 1, existing).astype(np.intp)
+
+        rows = rows[[col for col in rows.columns if col in self.product_data.columns]]
+        self.product_data = pd.concat([self.product_data, rows], ignore_index=True).iloc[order].reset_index(drop=True)
+        self.product_vectors = sparse.vstack([self.product_vectors, vectors], format='csr')[order]
 
-        enhanced_query = query
-        if 'bestseller' in query.lower() or 'popular' in query.lower():
-            enhanced_query += " bestseller popular top selling"
-        if 'highly rated' in query.lower() or 'top rated' in query.lower():
-            enhanced_query += " highly rated recommended"
+        # Derived structures: cheap vectorized rebuilds over the updated rows
+        self.build_column_arrays()
+        self.build_signal_arrays()
+        if self.term_index is not None:
+            self.term_index = InvertedIndex().fit(self.product_vectors)
+        if self.ann_index is not None:
+            self.ann_index.update(self.product_vectors, changed)
+        self.build_cluster_index()
+        self.build_filter_index()
 
-        query_vector = self.tfidf.transform([self.preprocess_text(enhanced_query)])
-        similarities = cosine_similarity(query_vector, self.product_vectors).flatten()
+        analyzer = self.tfidf.build_analyzer()
+        tokens = [token for text in texts for token in analyzer(text)]
+        self.drift['changed_products'] += len(rows)
+        self.drift['tokens'] += len(tokens)
+        self.drift['unknown_tokens'] += sum(token not in self.tfidf.vocabulary_ for token in tokens)
+        self.compact_product_data()
+        print(f"Upserted {int((~is_new).sum())} changed and {int(is_new.sum())} new products")
+        return int((~is_new).sum()), int(is_new.sum())
+
+    def drift_report(self):
+        tokens = self.drift['tokens']
+        return {
+            'age_s': time.time() - self.fit_info['fitted_at'],
+            'changed_fraction': self.drift['changed_products'] / max(self.fit_info['products'], 1),
+            'unknown_token_rate': self.drift['unknown_tokens'] / tokens if tokens else 0.0,
+        }
+
+    def needs_refit(self):
+        """Return why the model should be refit from scratch, or None while incremental updates suffice"""
+        report = self.drift_report()
+        if report['age_s'] > REFIT_INTERVAL_S:
+            return f"last fit was {report['age_s'] / 3600:.0f}h ago"
+        if report['changed_fraction'] > REFIT_MAX_CHANGED:
+            return f"{report['changed_fraction']:.0%} of the catalog changed since the last fit"
+        # A handful of new products with unusual titles says little about the vocabulary
+        if (report['changed_fraction'] >= REFIT_MIN_VOCAB_SAMPLE
+                and report['unknown_token_rate'] > REFIT_MAX_UNKNOWN_TOKENS):
+            return f"{report['unknown_token_rate']:.0%} of new product tokens are outside the vocabulary"
+        return None
+
+    def build_filter_index(self):
+        # Bitsets for the fixed query constraints and categories, and a price-sorted index
+        codes = self.cluster_index.get('category_codes')
+        self.filter_index = FilterIndex().fit(
+            self.column_arrays['price'],
+            sales_rank=self.column_arrays.get('sales_rank'),
+            rating=self.column_arrays.get('rating'),
+            category_codes=codes,
+            n_categories=len(self.category_names) if codes is not None else 0,
+        )
+
+    def build_query_matchers(self):
+        # Lookups from query text to cluster features, derived from the cluster index
+        self.feature_positions = {col: i for i, col in enumerate(self.feature_columns)}
+        # One regex finds every category name occurring in a query. Alternatives
+        # are listed in catalog order and the lookahead reports a match at every
+        # position, so the lowest-ranked match is the first category a scan of
+        # the catalog's categories would have found.
+        self.category_ranks = {}
+        for code, name in enumerate(self.category_names):
+            if isinstance(name, str):
+                self.category_ranks.setdefault(name.lower(), code)
+        alternatives = sorted(self.category_ranks, key=self.category_ranks.get)
+        self.category_matcher = None
+        if alternatives:
+            self.category_matcher = re.compile('(?=(' + '|'.join(map(re.escape, alternatives)) + '))')
+
+    def match_category(self, query):
+        """Return the catalog code of the first category named in the query, or None"""
+        if self.category_matcher is None:
+            return None
+        ranks = [self.category_ranks[m.group(1)] for m in self.category_matcher.finditer(query.lower())]
+        return min(ranks) if ranks else None
+
+    def predict_query_cluster(self, features):
+        """Nearest KMeans centroid for a feature dict, without building a DataFrame"""
+        x = np.zeros(len(self.feature_columns))
+        for col, value in features.items():
+            x[self.feature_positions[col]] = value
+        if self.scaler.with_mean:
+            x -= self.scaler.mean_
+        if self.scaler.with_std:
+            x /= self.scaler.scale_
+        return int(np.argmin(((self.kmeans.cluster_centers_ - x) ** 2).sum(axis=1)))
+
+    def records(self, positions):
+        if len(positions) == 0:
+            return []
+        if self.catalog is None:
+            # Same conversion as the persisted columns, so both paths return identical values
+            return ProductTable.from_frame(self.product_data.iloc[positions][RESULT_FIELDS]).records(
+                range(len(positions)), RESULT_FIELDS)
+        return self.catalog.records(positions, RESULT_FIELDS)
+
+    def score_products(self, query_vector, positions=None):
+        # TF-IDF rows and queries are L2-normalized, so cosine similarity is a
+        # plain sparse dot product; scoring a subset of rows gives bit-identical
+        # values to scoring the whole catalog
+        vectors = self.product_vectors if positions is None else self.product_vectors[positions]
+        return (vectors @ query_vector.T).toarray().ravel()
+
+    def query_filters(self, query):
+        """
+        Turn the price range and popularity/rating wording of a query into
+        functions over product positions (an index array, or slice(None) for
+        all products).
+        Returns:
+            tuple: (accept, boost, max_boost) where accept(positions) is the bool
+                filter mask, boost(positions) the score multiplier and max_boost
+                its upper bound over the catalog
+        """
+        wants_popular = 'bestseller' in query.lower() or 'popular' in query.lower()
+        wants_rated = 'highly rated' in query.lower() or 'top rated' in query.lower()
 
         max_price = float('inf')
         min_price = 0
@@ -113,44 +628,131 @@ class AmazonProductRecommender:
             if match:
                 min_price = float(match.group(1))
 
-        filtered_indices = [
-            i for i in range(len(similarities))
-            if min_price <= self.product_data.iloc[i]['price'] <= max_price
-        ]
+        # The bestseller (bottom 20% of sales_rank) and rating >= 4 constraints are
+        # precomputed bitsets; only the price range depends on the query
+        constraints = []
+        if wants_popular and self.filter_index.has('bestseller'):
+            constraints.append('bestseller')
+        if wants_rated and self.filter_index.has('highly_rated'):
+            constraints.append('highly_rated')
+        allowed = self.filter_index.combined(constraints)
+
+        def accept(positions):
+            if isinstance(positions, slice):
+                mask = self.filter_index.price_mask(min_price, max_price)
+            else:
+                price = self.column_arrays['price'][positions]
+                mask = (price >= min_price) & (price <= max_price)
+            if allowed is not None:
+                mask &= self.filter_index.contains(allowed, positions)
+            return mask
+
+        # Boost relevant products by their popularity/rating signal. The boost is
+        # multiplicative so products that share no term with the query stay at 0.
+        max_boost = 1.0
+        if wants_popular:
+            max_boost *= 1 + POPULARITY_WEIGHT
+        if wants_rated:
+            max_boost *= 1 + QUALITY_WEIGHT
+
+        def boost(positions):
+            factor = 1.0
+            if wants_popular:
+                factor = factor * (1 + POPULARITY_WEIGHT * self.column_arrays['popularity'][positions])
+            if wants_rated:
+                factor = factor * (1 + QUALITY_WEIGHT * self.column_arrays['quality'][positions])
+            return factor
+
+        return accept, boost, max_boost
+
+    def rank_candidates(self, candidates, similarities, accept, boost, top_n):
+        """
+        Top_n positions from candidates that hold every product with a positive
+        similarity. Products outside them score 0 and, as in a full scan, fill
+        any remaining places in catalog order.
+        """
+        scores = similarities * boost(candidates)
+        kept = np.flatnonzero(accept(candidates))
+        top_indices = top_n_indices(scores[kept], candidates[kept], top_n)
+        if len(top_indices) < top_n:
+            mask = accept(slice(None))
+            mask[candidates] = False
+            fill = np.flatnonzero(mask)[:top_n - len(top_indices)]
+            top_indices = np.concatenate([top_indices, fill])
+        return top_indices
 
-        if 'bestseller' in query.lower() or 'popular' in query.lower():
-            if 'sales_rank' in self.product_data.columns:
-                sales_threshold = self.product_data['sales_rank'].quantile(0.2)
-                filtered_indices = [
-                    i for i in filtered_indices
-                    if self.product_data.iloc[i]['sales_rank'] <= sales_threshold
-                ]
-
-        if 'highly rated' in query.lower() or 'top rated' in query.lower():
-            if 'rating' in self.product_data.columns:
-                filtered_indices = [
-                    i for i in filtered_indices
-                    if self.product_data.iloc[i]['rating'] >= 4.0
-                ]
-
-        if filtered_indices:
-            filtered_similarities = [(i, similarities[i]) for i in filtered_indices]
-            sorted_indices = sorted(filtered_similarities, key=lambda x: x[1], reverse=True)
-            top_indices = [idx for idx, _ in sorted_indices[:top_n]]
-            recommendations = self.product_data.iloc[top_indices]
-            result_fields = ['asin', 'title', 'category', 'price', 'rating', 'review_count', 'sales_rank', 'imgUrl', 'productURL']
-            return recommendations[result_fields].to_dict('records')
-        return []
+    def get_recommendations_cosine(self, query, top_n=5, n_probe=None):
+        """
+        Args:
+            query (str): Free-text query
+            top_n (int): Number of recommendations
+            n_probe (int): Inverted lists the ANN index scans (default: self.ann_n_probe).
+                Higher is closer to the exact ranking but slower; 0 forces the exact ranking.
+        """
+        if not self.cosine_model:
+            self.build_cosine_model()
+
+        query_vector = self.tfidf.transform([self.preprocess_text(query)])
+        accept, boost, max_boost = self.query_filters(query)
+
+        if n_probe is None:
+            n_probe = self.ann_n_probe
+        if self.ann_index is not None and n_probe > 0:
+            n_candidates = max(ANN_MIN_CANDIDATES, top_n * ANN_CANDIDATE_FACTOR)
+            candidates = self.ann_index.search(query_vector, n_candidates, n_probe)
+            scores = self.score_products(query_vector, candidates) * boost(candidates)
+            kept = np.flatnonzero(accept(candidates))
+            top_indices = top_n_indices(scores[kept], candidates[kept], top_n)
+            if len(top_indices) < top_n:
+                # Too few approximate candidates survived the filters
+                return self.get_recommendations_cosine(query, top_n, n_probe=0)
+        elif self.term_index is not None:
+            candidates = self.term_index.search(query_vector, top_n, accept, boost, max_boost)
+            similarities = self.score_products(query_vector, candidates)
+            top_indices = self.rank_candidates(candidates, similarities, accept, boost, top_n)
+        else:
+            # Only score the products the filters let through
+            kept = np.flatnonzero(accept(slice(None)))
+            scores = self.score_products(query_vector, kept) * boost(kept)
+            top_indices = top_n_indices(scores, kept, top_n)
+
+        return self.records(top_indices)
+
+    def get_recommendations_cosine_batch(self, queries, top_n=5):
+        """
+        Cosine recommendations for many queries at once: all queries are
+        vectorized together and scored against the catalog with a single
+        sparse matrix product, then filtered and ranked per query. Results are
+        identical to calling get_recommendations_cosine on each query exactly.
+        """
+        if not self.cosine_model:
+            self.build_cosine_model()
+        if not queries:
+            return []
+
+        query_vectors = self.tfidf.transform([self.preprocess_text(q) for q in queries])
+        # products x queries; column j holds the products with a positive score for query j
+        scores = (self.product_vectors @ query_vectors.T).tocsc()
+        per_query = []
+        for j, query in enumerate(queries):
+            accept, boost, _ = self.query_filters(query)
+            column = slice(scores.indptr[j], scores.indptr[j + 1])
+            candidates = scores.indices[column].astype(np.intp)
+            per_query.append(self.rank_candidates(candidates, scores.data[column], accept, boost, top_n))
+
+        # Materialize every query's records in one DataFrame lookup, then split
+        records = self.records(np.concatenate(per_query))
+        bounds = np.cumsum([0] + [len(top_indices) for top_indices in per_query])
+        return [records[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
 
     def get_recommendations_cluster(self, query, top_n=5):
         if not self.cluster_model:
             self.build_cluster_model()
 
-        category = None
-        for cat in self.product_data['category'].unique():
-            if isinstance(cat, str) and cat.lower() in query.lower():
-                category = cat
-                break
+        category_code = self.match_category(query)
+        # Empty category names never narrowed the search
+        if category_code is not None and not self.category_names[category_code]:
+            category_code = None
 
         max_price = float('inf')
         if 'under' in query.lower():
@@ -158,45 +760,45 @@ class AmazonProductRecommender:
             if match:
                 max_price = float(match.group(1))
 
-        test_features = pd.DataFrame(columns=self.feature_columns)
-        test_features.loc[0, 'price'] = max_price / 2
-        if 'sales_score' in self.feature_columns and ('bestseller' in query.lower() or 'popular' in query.lower()):
-            test_features.loc[0, 'sales_score'] = 0.9
-        if 'rating' in self.feature_columns and ('highly rated' in query.lower() or 'top rated' in query.lower()):
-            test_features.loc[0, 'rating'] = 4.5
-        if category:
-            category_col = f'category_{category}'
-            if category_col in self.feature_columns:
-                test_features.loc[0, category_col] = 1
-
-        test_features = test_features.fillna(0)
-        for col in self.feature_columns:
-            if col not in test_features.columns:
-                test_features[col] = 0
-
-        scaled_test_features = self.scaler.transform(test_features[self.feature_columns])
-        cluster = self.kmeans.predict(scaled_test_features)[0]
-
-        cluster_products = self.product_data[self.product_data['cluster'] == cluster].copy()
-        if max_price < float('inf'):
-            cluster_products = cluster_products[cluster_products['price'] <= max_price]
-        if category and 'category' in self.product_data.columns:
-            category_products = cluster_products[cluster_products['category'] == category]
-            if not category_products.empty:
-                cluster_products = category_products
-
-        if 'bestseller' in query.lower() or 'popular' in query.lower():
-            if 'sales_rank' in cluster_products.columns:
-                cluster_products = cluster_products.sort_values('sales_rank')
-        elif 'highly rated' in query.lower() or 'top rated' in query.lower():
-            if 'rating' in cluster_products.columns:
-                cluster_products = cluster_products.sort_values('rating', ascending=False)
-        elif 'sales_rank' in cluster_products.columns:
-            cluster_products = cluster_products.sort_values('sales_rank')
-
-        recommendations = cluster_products.head(top_n)
-        result_fields = ['asin', 'title', 'category', 'price', 'rating', 'review_count', 'sales_rank', 'imgUrl', 'productURL']
-        return recommendations[result_fields].to_dict('records')
+        # Without a price cap the price feature stays at its default of 0
+        features = {'price': max_price / 2 if max_price < float('inf') else 0}
+        if 'sales_score' in self.feature_positions and ('bestseller' in query.lower() or 'popular' in query.lower()):
+            features['sales_score'] = 0.9
+        if 'rating' in self.feature_positions and ('highly rated' in query.lower() or 'top rated' in query.lower()):
+            features['rating'] = 4.5
+        if category_code is not None:
+            category_col = f'category_{self.category_names[category_code]}'
+            if category_col in self.feature_positions:
+                features[category_col] = 1
+        cluster = self.predict_query_cluster(features)
+
+        if ('bestseller' in query.lower() or 'popular' in query.lower()) and 'by_sales_rank' in self.cluster_index:
+            ordering = 'by_sales_rank'
+        elif ('highly rated' in query.lower() or 'top rated' in query.lower()) and 'by_rating' in self.cluster_index:
+            ordering = 'by_rating'
+        elif 'by_sales_rank' in self.cluster_index:
+            ordering = 'by_sales_rank'
+        else:
+            ordering = 'by_position'
+        offsets = self.cluster_index['offsets']
+        members = self.cluster_index[ordering][offsets[cluster]:offsets[cluster + 1]]
+
+        price = self.column_arrays['price']
+        def within_price(positions):
+            if max_price < float('inf'):
+                return price[positions] <= max_price
+            return np.ones(len(positions), dtype=bool)
+
+        top_indices = np.empty(0, dtype=np.intp)
+        if category_code is not None:
+            in_category = self.filter_index.category(category_code)
+            top_indices = first_matching(
+                members,
+                lambda positions: within_price(positions) & self.filter_index.contains(in_category, positions),
+                top_n)
+        if len(top_indices) == 0:
+            top_indices = first_matching(members, within_price, top_n)
+        return self.records(top_indices)
 
     def get_recommendations(self, user_input, method='hybrid', top_n=5):
         if method == 'cosine':
@@ -206,28 +808,176 @@ class AmazonProductRecommender:
         else:
             cosine_recs = self.get_recommendations_cosine(user_input, top_n)
             cluster_recs = self.get_recommendations_cluster(user_input, top_n)
-            all_recs = cosine_recs + cluster_recs
-            unique_recs = []
-            seen_ids = set()
-            for rec in all_recs:
-                if rec['asin'] not in seen_ids:
-                    unique_recs.append(rec)
-                    seen_ids.add(rec['asin'])
-                    if len(unique_recs) >= top_n:
-                        break
-            return unique_recs
-
-# Singleton instance
-recommender = AmazonProductRecommender()
-
-def get_recommendations(query_params):
+            return merge_recommendations(cosine_recs, cluster_recs, top_n)
+
+    def get_recommendations_batch(self, user_inputs, method='hybrid', top_n=5):
+        if method == 'cluster':
+            return [self.get_recommendations_cluster(user_input, top_n) for user_input in user_inputs]
+        cosine_recs = self.get_recommendations_cosine_batch(user_inputs, top_n)
+        if method == 'cosine':
+            return cosine_recs
+        return [
+            merge_recommendations(recs, self.get_recommendations_cluster(user_input, top_n), top_n)
+            for user_input, recs in zip(user_inputs, cosine_recs)
+        ]
+
+def merge_recommendations(cosine_recs, cluster_recs, top_n):
+    # Hybrid results: cosine first, then cluster picks, without repeating a product
+    unique_recs = []
+    seen_ids = set()
+    for rec in cosine_recs + cluster_recs:
+        if rec['asin'] not in seen_ids:
+            unique_recs.append(rec)
+            seen_ids.add(rec['asin'])
+            if len(unique_recs) >= top_n:
+                break
+    return unique_recs
+
+# Results of the API wrappers below, keyed on the model build and the normalized
+# query string (which encodes every filter the model uses)
+result_cache = ResultCache(
+    max_size=int(os.environ.get("RECOMMEND_CACHE_SIZE", 1024)),
+    ttl=float(os.environ.get("RECOMMEND_CACHE_TTL_S", 300)),
+)
+
+def load_previous(artifact_dir=ARTIFACT_DIR):
+    """The last persisted model, even if stale (e.g. to warm-start a refit), or None"""
+    if model_store.read_manifest(artifact_dir) is None:
+        return None
+    try:
+        return AmazonProductRecommender.from_artifacts(artifact_dir)
+    except Exception as e:
+        print(f"Could not load the previous model artifacts: {e}")
+        return None
+
+def load_recommender(artifact_dir=ARTIFACT_DIR, db_path=DB_PATH):
     """
-    Wrapper for API integration
+    Load the persisted model if it is current with the database, otherwise
+    train from the database and persist the result for the next process.
+    """
+    result_cache.clear()
+    if not model_store.is_stale(artifact_dir, db_path):
+        try:
+            return AmazonProductRecommender.from_artifacts(artifact_dir)
+        except Exception as e:
+            print(f"Could not load model artifacts, retraining: {e}")
+    else:
+        print(f"Model artifacts in '{artifact_dir}' are missing or stale, retraining")
+
+    model = AmazonProductRecommender(db_path, warm_start=load_previous(artifact_dir))
+    try:
+        model.save_artifacts(artifact_dir, db_path)
+    except OSError as e:
+        print(f"Could not save model artifacts: {e}")
+        return model
+    # Serve from the memory-mapped copy: its pages are file-backed, so they are
+    # shared by every process (e.g. forked workers) that maps the same build
+    return AmazonProductRecommender.from_artifacts(artifact_dir)
+
+def read_products(asins, db_path=DB_PATH, batch_size=500):
+    """
+    Complete rows of the given products from the database.
     Args:
-        query_params (dict): From API (e.g., {"keywords": "running shoes", "price": 100.0})
+        asins (list): Products to read, by asin
     Returns:
-        list: List of recommendation dicts
+        pd.DataFrame: Rows in the products table schema
     """
+    asins = list(asins)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        # In batches, below SQLite's limit on bound parameters
+        frames = [
+            pd.read_sql_query(
+                f"SELECT * FROM products WHERE asin IN ({', '.join('?' for _ in batch)})", conn, params=batch)
+            for batch in (asins[start:start + batch_size] for start in range(0, len(asins), batch_size))
+        ]
+    finally:
+        conn.close()
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def update_catalog(products, db_path=DB_PATH, artifact_dir=ARTIFACT_DIR, force_refit=False):
+    """
+    Upsert products into the database and the persisted model, refitting from
+    scratch only when forced, when the artifacts are out of date or when
+    needs_refit() reports too much drift.
+    Args:
+        products (pd.DataFrame): Rows in the products table schema, matched by asin;
+            existing products only need the columns that changed
+    Returns:
+        str: The new build id
+    """
+    stale = model_store.is_stale(artifact_dir, db_path)
+    manifest = model_store.read_manifest(artifact_dir)
+    ann_probe = manifest.get('ann_n_probe', 0) if manifest else 0
+    query_db.upsert_products(products, db_path)
+
+    model = None
+    previous = None
+    if not (force_refit or stale):
+        model = AmazonProductRecommender.from_artifacts(artifact_dir, mmap=False)
+        # products may only carry the changed columns (e.g. asin and price);
+        # the model needs the complete rows as they are now in the database
+        model.upsert_products(read_products(products['asin'].unique(), db_path))
+        reason = model.needs_refit()
+        if reason:
+            print(f"Refitting the model: {reason}")
+            previous, model = model, None
+    if model is None:
+        # The refit clustering starts from the previous centroids when there are any
+        if previous is None:
+            previous = load_previous(artifact_dir)
+        model = AmazonProductRecommender(db_path, warm_start=previous)
+        if ann_probe > 0:
+            model.build_ann_index(n_probe=ann_probe)
+    return model.save_artifacts(artifact_dir, db_path)
+
+# Singleton instance, loaded on first use (the build and update commands below train their own)
+_recommender = None
+_recommender_lock = threading.Lock()
+_published_build = None
+_published_checked_at = None
+_unloadable_build = None
+
+def published_build_id():
+    """Build named by the CURRENT pointer in ARTIFACT_DIR, re-read at most every MODEL_RELOAD_CHECK_S"""
+    global _published_build, _published_checked_at
+    now = time.monotonic()
+    if _published_checked_at is None or now - _published_checked_at >= MODEL_RELOAD_CHECK_S:
+        _published_checked_at = now
+        build_dir = model_store.current_build(ARTIFACT_DIR)
+        _published_build = os.path.basename(build_dir) if build_dir else None
+    return _published_build
+
+def get_recommender():
+    """
+    The shared recommender, loaded (or trained) by the first caller and
+    reloaded once the build or update command publishes a new build
+    """
+    global _recommender, _unloadable_build
+    build_id = published_build_id()
+    if _recommender is None or build_id not in (None, _recommender.build_id, _unloadable_build):
+        with _recommender_lock:
+            if _recommender is None:
+                _recommender = load_recommender()
+            elif build_id not in (None, _recommender.build_id, _unloadable_build):
+                try:
+                    model = AmazonProductRecommender.from_artifacts(ARTIFACT_DIR)
+                except Exception as e:
+                    # Not retried until another build is published
+                    _unloadable_build = build_id
+                    print(f"Could not load model build {build_id}, keeping {_recommender.build_id}: {e}")
+                else:
+                    result_cache.clear()
+                    _recommender = model
+    return _recommender
+
+def __getattr__(name):
+    # ml_module.recommender keeps working, but only loads the model when accessed
+    if name == "recommender":
+        return get_recommender()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def build_query_string(query_params):
     # Convert query_params dict to a string query
     query_str = ""
     if "keywords" in query_params:
@@ -238,5 +988,71 @@ def get_recommendations(query_params):
         query_str += f" highly rated" if query_params["stars"] >= 4.0 else ""
     if "boughtInLastMonth" in query_params and query_params["boughtInLastMonth"] > 100:
         query_str += " bestselling"
+    # The model is case-insensitive, so equivalent queries share one cache entry
+    return " ".join(query_str.lower().split())
+
+def recommendation_cache_key(query_params):
+    return (get_recommender().build_id, build_query_string(query_params))
+
+def get_recommendations(query_params, use_cache=True):
+    """
+    Wrapper for API integration
+    Args:
+        query_params (dict): From API (e.g., {"keywords": "running shoes", "price": 100.0})
+        use_cache (bool): Serve repeated queries from result_cache
+    Returns:
+        list: List of recommendation dicts
+    """
+    key = recommendation_cache_key(query_params)
+    if use_cache:
+        cached = result_cache.get(key)
+        if cached is not None:
+            return cached
+    recommendations = get_recommender().get_recommendations(key[1], method='hybrid', top_n=5)
+    if use_cache:
+        result_cache.put(key, recommendations)
+    return recommendations
+
+def get_recommendations_batch(query_params_list, use_cache=True):
+    """
+    Batch wrapper for API integration
+    Args:
+        query_params_list (list): One query_params dict per query
+        use_cache (bool): Serve repeated queries from result_cache and only score the rest
+    Returns:
+        list: One list of recommendation dicts per query, in order
+    """
+    keys = [recommendation_cache_key(query_params) for query_params in query_params_list]
+    results = [result_cache.get(key) if use_cache else None for key in keys]
+    missing = [i for i, recommendations in enumerate(results) if recommendations is None]
+    if missing:
+        scored = get_recommender().get_recommendations_batch([keys[i][1] for i in missing], method='hybrid', top_n=5)
+        for i, recommendations in zip(missing, scored):
+            results[i] = recommendations
+            if use_cache:
+                result_cache.put(keys[i], recommendations)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or update the recommender model artifacts")
+    parser.add_argument("command", choices=["build", "update"])
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database with the products table")
+    parser.add_argument("--out", default=ARTIFACT_DIR, help="Artifact directory")
+    parser.add_argument("--snapshot", help="build: train on this catalog snapshot instead of the database")
+    parser.add_argument("--ann-probe", type=int, default=0,
+                        help="Also build the approximate cosine index, scanning this many lists per query")
+    parser.add_argument("--csv", help="update: CSV of new or changed products in the products table schema "
+                                      "(changed ones only need asin and the columns that changed)")
+    parser.add_argument("--refit", action="store_true", help="update: refit the model instead of updating it")
+    args = parser.parse_args()
 
-    return recommender.get_recommendations(query_str.strip(), method='hybrid', top_n=5)
+    if args.command == "build":
+        product_data = read_snapshot(args.snapshot).to_frame() if args.snapshot else None
+        model = AmazonProductRecommender(args.db, product_data=product_data)
+        if args.ann_probe > 0:
+            model.build_ann_index(n_probe=args.ann_probe)
+        model.save_artifacts(args.out, args.db)
+    elif args.command == "update":
+        if not args.csv:
+            parser.error("update needs --csv")
+        update_catalog(pd.read_csv(args.csv), args.db, args.out, force_refit=args.refit)
@@ -0,0 +1,182 @@
+"""
+Versioned on-disk artifacts for the ml_module recommender.
+
+A build is written to its own directory and published by atomically replacing
+a CURRENT pointer file, so workers never see a half-written model:
+
+    model_artifacts/
+        CURRENT              # name of the active build directory
+        <build_id>/
+            manifest.json    # format version, library versions, DB fingerprint
+            <name>.npy       # large arrays, loaded memory-mapped
+            <name>.pkl       # small Python objects (vectorizer, scaler, KMeans)
+"""
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import time
+import uuid
+from importlib import metadata
+
+import numpy as np
+
+# Bump when the set or meaning of the saved arrays/objects changes
+ARTIFACT_VERSION = 7
+KEEP_BUILDS = 2
+
+
+def sklearn_version():
+    # From the package metadata: importing sklearn just to read its version takes over a second
+    return metadata.version("scikit-learn")
+
+
+def db_fingerprint(db_path):
+    """
+    Cheap summary of the products table used to detect stale artifacts.
+    Databases built by setup_database.py record a build id per rebuild and count
+    every later insert, update and delete in products_version (kept by triggers),
+    which also sees changes still in the WAL file; older ones fall back to the
+    size and mtime of the DB and WAL files.
+    Args:
+        db_path (str): Path to the SQLite database
+    Returns:
+        dict: Row count, max rowid and build id/change counter (or file size/mtime), or None if the DB is missing
+    """
+    if not os.path.exists(db_path):
+        return None
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rows, max_rowid = conn.execute("SELECT COUNT(*), MAX(rowid) FROM products").fetchone()
+        try:
+            version = conn.execute("SELECT build, changes FROM products_version WHERE id = 0").fetchone()
+        except sqlite3.OperationalError:  # Built before the version table
+            version = None
+    finally:
+        conn.close()
+    fingerprint = {"rows": rows, "max_rowid": max_rowid}
+    if version is not None:
+        fingerprint.update(build=version[0], changes=version[1])
+        return fingerprint
+    stat = os.stat(db_path)
+    fingerprint.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    # Committed changes stay in the -wal file until a checkpoint, which never
+    # happens while a reader is open
+    if os.path.exists(f"{db_path}-wal"):
+        wal = os.stat(f"{db_path}-wal")
+        fingerprint.update(wal_size=wal.st_size, wal_mtime_ns=wal.st_mtime_ns)
+    return fingerprint
+
+
+def current_build(artifact_dir):
+    """Return the directory of the active build, or None if nothing was published"""
+    try:
+        with open(os.path.join(artifact_dir, "CURRENT")) as f:
+            build_id = f.read().strip()
+    except FileNotFoundError:
+        return None
+    build_dir = os.path.join(artifact_dir, build_id)
+    return build_dir if os.path.isdir(build_dir) else None
+
+
+def read_manifest(artifact_dir):
+    build_dir = current_build(artifact_dir)
+    if build_dir is None:
+        return None
+    with open(os.path.join(build_dir, "manifest.json")) as f:
+        return json.load(f)
+
+
+def is_stale(artifact_dir, db_path):
+    """
+    True if there is no usable build, it was written by another artifact
+    format or scikit-learn version, or the products table changed since.
+    """
+    manifest = read_manifest(artifact_dir)
+    if manifest is None:
+        return True
+    if manifest.get("version") != ARTIFACT_VERSION or manifest.get("sklearn") != sklearn_version():
+        return True
+    fingerprint = db_fingerprint(db_path)
+    return fingerprint is not None and manifest.get("db") != fingerprint
+
+
+def write_artifacts(artifact_dir, arrays, objects, metadata=None):
+    """
+    Write a new build and publish it.
+    Args:
+        artifact_dir (str): Root artifact directory
+        arrays (dict): name -> np.ndarray, saved as .npy
+        objects (dict): name -> picklable object
+        metadata (dict): Extra manifest fields (e.g. the DB fingerprint)
+    Returns:
+        str: The new build id
+    """
+    os.makedirs(artifact_dir, exist_ok=True)
+    build_id = f"v{ARTIFACT_VERSION}-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    build_dir = os.path.join(artifact_dir, build_id)
+    os.makedirs(build_dir)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(build_dir, f"{name}.npy"), np.ascontiguousarray(array), allow_pickle=False)
+    for name, obj in objects.items():
+        with open(os.path.join(build_dir, f"{name}.pkl"), "wb") as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    manifest = {
+        "version": ARTIFACT_VERSION,
+        "build_id": build_id,
+        "built_at": time.time(),
+        "sklearn": sklearn_version(),
+        "arrays": sorted(arrays),
+        "objects": sorted(objects),
+        **(metadata or {}),
+    }
+    with open(os.path.join(build_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    # Publish atomically, then drop builds nobody points at any more
+    pointer_tmp = os.path.join(artifact_dir, f"CURRENT.{uuid.uuid4().hex}")
+    with open(pointer_tmp, "w") as f:
+        f.write(build_id)
+    os.replace(pointer_tmp, os.path.join(artifact_dir, "CURRENT"))
+    _prune_builds(artifact_dir, keep=build_id)
+    return build_id
+
+
+def read_artifacts(artifact_dir, mmap=True):
+    """
+    Load the active build.
+    Args:
+        artifact_dir (str): Root artifact directory
+        mmap (bool): Memory-map the arrays read-only instead of reading them into RAM
+    Returns:
+        tuple: (manifest, arrays, objects), or None if nothing was published
+    """
+    build_dir = current_build(artifact_dir)
+    if build_dir is None:
+        return None
+    with open(os.path.join(build_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    arrays = {
+        name: np.load(os.path.join(build_dir, f"{name}.npy"), mmap_mode="r" if mmap else None)
+        for name in manifest["arrays"]
+    }
+    objects = {}
+    for name in manifest["objects"]:
+        with open(os.path.join(build_dir, f"{name}.pkl"), "rb") as f:
+            objects[name] = pickle.load(f)
+    return manifest, arrays, objects
+
+
+def _prune_builds(artifact_dir, keep):
+    builds = sorted(
+        (entry for entry in os.scandir(artifact_dir) if entry.is_dir() and entry.name.startswith("v")),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True,
+    )
+    # Keep the newest few so workers still mapping an old build are not pulled out from under
+    for entry in builds[KEEP_BUILDS:]:
+        if entry.name != keep:
+            shutil.rmtree(entry.path, ignore_errors=True)
@@ -1,26 +1,136 @@
+import os
+import queue
+import re
 import sqlite3
+import threading
+from contextlib import contextmanager
 
-def get_products(query_params, limit=5):
+DB_PATH = "products.db"
+
+# Columns the API returns; rows come back as tuples in this order
+PRODUCT_COLUMNS = ["asin", "title", "price", "stars", "reviews", "category_id",
+                   "isBestSeller", "boughtInLastMonth", "imgUrl", "productURL"]
+
+# Per-connection read tuning
+MMAP_SIZE = 256 * 1024 * 1024   # bytes of the DB file mapped into memory
+CACHE_SIZE_KB = 64 * 1024       # page cache per connection
+STATEMENT_CACHE_SIZE = 128      # prepared statements kept per connection
+
+
+def quote_identifier(name):
+    """Quote a column name (e.g. a CSV header with spaces or a reserved word) for SQL"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def sqlite_values(frame):
+    """DataFrame -> the same rows as values sqlite3 can bind (object dtype: Python numbers, None for NaN)"""
+    return frame.astype(object).where(frame.notna(), None)
+
+
+class ConnectionPool:
     """
-    Query the products database and return top recommendations based on user preferences.
-    
-    Args:
-        query_params (dict): Dictionary with keys like 'keywords', 'price', 'stars', etc.
-                             Example: {"keywords": "running shoes", "price": 100.0}
-        limit (int): Maximum number of results to return (default: 5).
-    
-    Returns:
-        list: List of tuples, top 'limit' product rows sorted by relevance.
+    Thread-safe pool of read-only SQLite connections.
+    Connections are opened lazily up to max_size and reused, so a query pays
+    neither connection setup nor statement preparation after warm-up. The pool
+    is per process: after a fork the child drops the inherited connections.
     """
-    # Connect to the database
-    conn = sqlite3.connect("products.db")
-    cursor = conn.cursor()
 
-    # Build the SQL query dynamically
-    sql = "SELECT * FROM products WHERE 1=1"
-    params = []
+    def __init__(self, db_path=DB_PATH, max_size=8, timeout=5.0):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self.has_fts = None
+
+    def _connect(self):
+        # mode=ro never creates or writes the file; setup_database.py leaves it in
+        # WAL mode, so these readers run concurrently with a writer
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+        conn.execute("PRAGMA query_only=ON")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        if self.has_fts is None:
+            # Databases built before the full-text index fall back to LIKE
+            self.has_fts = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'products_fts'").fetchone() is not None
+        return conn
 
-    if "keywords" in query_params:
+    @contextmanager
+    def connection(self):
+        if self._pid != os.getpid():
+            self._reset()
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._opened < self.max_size:
+                    self._opened += 1
+                    opening = True
+                else:
+                    opening = False
+            if opening:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                conn = self._idle.get(timeout=self.timeout)
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._opened -= 1
+
+
+pool = ConnectionPool(DB_PATH, max_size=int(os.environ.get("DB_POOL_SIZE", 8)))
+
+def fts_match_expression(keywords):
+    """
+    Turn free-text keywords into an FTS5 MATCH expression that requires every
+    word; each word is quoted so user input can never inject FTS5 syntax.
+    Returns None when the keywords contain no words.
+    """
+    words = re.findall(r"\w+", keywords)
+    if not words:
+        return None
+    return " ".join('"' + word.replace('"', '""') + '"' for word in words)
+
+def build_products_query(query_params, limit=5, use_fts=True):
+    """
+    Build the filter SQL and its parameters. The SQL text only depends on which
+    filters are present, so the few distinct shapes stay in the statement cache.
+    """
+    match = fts_match_expression(query_params["keywords"]) if use_fts and "keywords" in query_params else None
+    if match is not None:
+        # Keyword search is an index lookup on products_fts, ranked by BM25
+        columns = ", ".join(f"products.{c}" for c in PRODUCT_COLUMNS)
+        sql = (f"SELECT {columns} FROM products_fts JOIN products ON products.rowid = products_fts.rowid"
+               " WHERE products_fts MATCH ?")
+        params = [match]
+    else:
+        sql = f"SELECT {', '.join(PRODUCT_COLUMNS)} FROM products WHERE 1=1"
+        params = []
+
+    if "keywords" in query_params and match is None:
         sql += " AND title LIKE ?"
         params.append(f"%{query_params['keywords']}%")
     if "price" in query_params:
@@ -42,18 +152,107 @@ def get_products(query_params, limit=5):
         sql += " AND boughtInLastMonth >= ?"
         params.append(query_params["boughtInLastMonth"])
 
-    # Sort by stars (descending) and boughtInLastMonth (descending), then limit
-    sql += " ORDER BY stars DESC, boughtInLastMonth DESC LIMIT ?"
+    # Sort by keyword relevance when searching, then by stars (descending) and
+    # boughtInLastMonth (descending), then limit
+    rank = "products_fts.rank, " if match is not None else ""
+    sql += f" ORDER BY {rank}stars DESC, boughtInLastMonth DESC LIMIT ?"
     params.append(limit)
+    return sql, params
+
+def get_products(query_params, limit=5):
+    """
+    Query the products database and return top recommendations based on user preferences.
+    
+    Args:
+        query_params (dict): Dictionary with keys like 'keywords', 'price', 'stars', etc.
+                             Example: {"keywords": "running shoes", "price": 100.0}
+        limit (int): Maximum number of results to return (default: 5).
+    
+    Returns:
+        list: List of tuples with the PRODUCT_COLUMNS of the top 'limit' products sorted by relevance.
+    """
+    # Borrow a pooled read-only connection; the statement is prepared once per connection
+    with pool.connection() as conn:
+        sql, params = build_products_query(query_params, limit, use_fts=pool.has_fts)
+        return conn.execute(sql, params).fetchall()
+
+def upsert_products(products, db_path=DB_PATH):
+    """
+    Insert new products and update existing ones, matched by asin, in one
+    transaction. The full-text index follows through the products_fts triggers.
+    Missing (NaN) values leave an existing product's column as it is, so changed
+    products only need asin and the changed columns; new products need every
+    NOT NULL column without a default (e.g. title), or nothing is written.
+    Args:
+        products (pd.DataFrame): Rows in the products table schema
+        db_path (str): Path to the SQLite database
+    Returns:
+        tuple: (number of updated products, number of inserted products)
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        table_info = conn.execute("PRAGMA table_info(products)").fetchall()
+        # (cid, name, type, notnull, dflt_value, pk)
+        required = [name for _, name, _, notnull, default, pk in table_info if notnull and default is None and not pk]
+        table_columns = {row[1] for row in table_info}
+        columns = [c for c in products.columns if c in table_columns and c not in ("asin", "product_id")]
+        rows = sqlite_values(products.drop_duplicates("asin", keep="last")[["asin"] + columns])
 
-    # Execute and fetch results
-    cursor.execute(sql, params)
-    results = cursor.fetchall()
+        quoted = [quote_identifier(c) for c in columns]
+        update_sql = f"UPDATE products SET {', '.join(f'{c} = COALESCE(?, {c})' for c in quoted)} WHERE asin = ?"
+        updated = inserted = 0
+        with conn:
+            for asin, *values in rows.itertuples(index=False, name=None):
+                if conn.execute(update_sql, values + [asin]).rowcount:
+                    updated += 1
+                    continue
+                # Only the given columns, so the others get their declared defaults
+                row = {"asin": asin, **{c: v for c, v in zip(columns, values) if v is not None}}
+                missing = [c for c in required if c not in row]
+                if missing:
+                    raise ValueError(f"New product {asin} has no value for {', '.join(missing)}")
+                conn.execute(f"INSERT INTO products ({', '.join(map(quote_identifier, row))}) "
+                             f"VALUES ({', '.join('?' for _ in row)})", list(row.values()))
+                inserted += 1
+    finally:
+        conn.close()
+    print(f"Upserted products into {db_path}: {updated} updated, {inserted} inserted")
+    return updated, inserted
 
-    # Close the connection
-    conn.close()
+# Structured filter combinations the API sends; keyword searches go through
+# products_fts and are ranked by BM25 instead
+COMMON_FILTERS = [
+    {},
+    {"price": 100.0},
+    {"stars": 4.0},
+    {"reviews": 50},
+    {"boughtInLastMonth": 100},
+    {"price": 100.0, "stars": 4.0},
+    {"price": 100.0, "reviews": 50},
+    {"category_id": 5},
+    {"category_id": 5, "price": 100.0},
+    {"category_id": 5, "stars": 4.0},
+    {"isBestSeller": True},
+    {"isBestSeller": True, "price": 100.0},
+    {"category_id": 5, "isBestSeller": True},
+]
 
-    return results
+def check_query_plans(conn, filters_list=COMMON_FILTERS):
+    """
+    Run EXPLAIN QUERY PLAN for each filter combination.
+    Returns:
+        list: (filters, plan) pairs whose plan scans the products table without
+              an index or sorts with a temporary B-tree; empty when all are indexed
+    """
+    problems = []
+    for filters in filters_list:
+        sql, params = build_products_query(filters, use_fts=False)
+        plan = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        full_scan = any(step.startswith("SCAN products") and "INDEX" not in step for step in plan)
+        temp_sort = any("TEMP B-TREE" in step for step in plan)
+        if full_scan or temp_sort:
+            problems.append((filters, plan))
+    return problems
 
 # Test the function
 if __name__ == "__main__":
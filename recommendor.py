@@ -1,59 +1,15 @@
 import pandas as pd
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-import re
 import random
 import time
 from collections import defaultdict
-import whisper
-import os
-from pydub import AudioSegment
-from pydub.exceptions import CouldntDecodeError
+from sample_data import make_sample_catalog
 
-# Load Whisper model globally (use 'base' for speed in a hackathon)
-model = whisper.load_model("base")
+# Memory for one block of dense similarities in build_similar_items_index
+SIMILARITY_BLOCK_BYTES = 256 * 2**20
 
-def convert_audio(input_path: str) -> str:
-    """
-    Converts audio to WAV (16-bit PCM, mono, 16kHz) for Whisper compatibility.
-    Returns path to converted file.
-    """
-    try:
-        output_path = "converted_audio.wav"
-        audio = AudioSegment.from_file(input_path)
-        audio = audio.set_channels(1).set_frame_rate(16000)  # Whisper expects 16kHz mono
-        audio.export(output_path, format="wav", codec="pcm_s16le")
-        return output_path
-    except CouldntDecodeError:
-        raise Exception(f"Failed to decode audio file: {input_path}")
-    except Exception as e:
-        raise Exception(f"Audio conversion error: {str(e)}")
-
-def transcribe_audio(file_path: str) -> str:
-    """
-    Transcribes audio file using Whisper and returns the text.
-    """
-    try:
-        print("Transcribing audio...")
-        converted_path = convert_audio(file_path)
-        result = model.transcribe(converted_path)
-        transcript = result["text"].strip()
-        
-        print(f"Transcription complete: {transcript}")
-        # Optionally save transcript (remove if not needed for hackathon)
-        with open("transcript.txt", "w") as f:
-            f.write(transcript)
-        
-        # Clean up temporary file
-        if os.path.exists(converted_path):
-            os.remove(converted_path)
-        
-        return transcript
-    except Exception as e:
-        raise Exception(f"Transcription error: {str(e)}")
+# scikit-learn and the transcription stack (Whisper, torch) are imported by the
+# methods that use them, so QueryGenerator and text-only use never load them
 
 # QueryGenerator class remains unchanged
 class QueryGenerator:
@@ -190,15 +146,33 @@ class QueryGenerator:
         return list(queries)
 
 class AmazonProductRecommender:
-    def __init__(self, amazon_data):
+    def __init__(self, amazon_data, similarity_mode='sparse', similar_items_k=0):
+        """
+        Args:
+            amazon_data (pd.DataFrame): Product catalog
+            similarity_mode (str): 'sparse' keeps only the L2-normalized TF-IDF rows
+                (memory linear in catalog size); 'dense' also materializes the full
+                N x N product similarity matrix
+            similar_items_k (int): If > 0, build a "similar products" index with the
+                top-k neighbors of every product when the cosine model is built
+        """
+        if similarity_mode not in ('sparse', 'dense'):
+            raise ValueError("similarity_mode must be 'sparse' or 'dense'")
         self.product_data = amazon_data
+        self.similarity_mode = similarity_mode
+        self.similar_items_k = similar_items_k
         self.cosine_model = None
         self.cluster_model = None
         self.tfidf_vectorizer = None
         self.tfidf_matrix = None
+        self.similar_indices = None
+        self.similar_scores = None
         self.query_generator = QueryGenerator(amazon_data)
 
     def build_cosine_model(self):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.metrics.pairwise import cosine_similarity
+
         print("Building cosine similarity model...")
         if 'title' not in self.product_data.columns:
             raise ValueError("Product data must contain a 'title' column")
@@ -212,12 +186,76 @@ class AmazonProductRecommender:
         else:
             self.product_data['text'] = self.product_data['title'].fillna('')
 
-        # Create and store TF-IDF matrix
+        # Create and store TF-IDF matrix. Rows come out L2-normalized, so the
+        # cosine similarity of a query to every product is a single sparse dot
+        # product and the sparse matrix is all that ranking needs.
         self.tfidf_vectorizer = TfidfVectorizer(stop_words='english', max_features=5000)
-        self.tfidf_matrix = self.tfidf_vectorizer.fit_transform(self.product_data['text'])
-        self.cosine_model = cosine_similarity(self.tfidf_matrix)
+        self.tfidf_matrix = self.tfidf_vectorizer.fit_transform(self.product_data['text']).tocsr()
+        if self.similarity_mode == 'dense':
+            self.cosine_model = cosine_similarity(self.tfidf_matrix)
+        else:
+            self.cosine_model = self.tfidf_matrix
+
+        if self.similar_items_k > 0:
+            self.build_similar_items_index(self.similar_items_k)
+
+    def build_similar_items_index(self, k=10, batch_size=1024):
+        """
+        Precompute the top-k most similar products for every product.
+        Similarities are computed one block of rows at a time, so peak memory is
+        batch_size x N instead of N x N, and the index itself is two compact
+        (N, k) arrays: int32 neighbor positions and float32 scores.
+        Args:
+            k (int): Neighbors kept per product
+            batch_size (int): Most rows per block; large catalogs use fewer, so a
+                block stays within SIMILARITY_BLOCK_BYTES
+        """
+        if self.tfidf_matrix is None:
+            self.build_cosine_model()
+        print(f"Building similar-items index (k={k})...")
+        n_products = self.tfidf_matrix.shape[0]
+        k = max(0, min(k, n_products - 1))
+        self.similar_indices = np.full((n_products, k), -1, dtype=np.int32)
+        self.similar_scores = np.zeros((n_products, k), dtype=np.float32)
+        if k == 0:
+            return
+
+        # Per block element: the float64 similarity, its negation and argpartition's int64 position
+        batch_size = max(1, min(batch_size, SIMILARITY_BLOCK_BYTES // (24 * n_products)))
+        matrix_t = self.tfidf_matrix.T.tocsc()
+        for start in range(0, n_products, batch_size):
+            stop = min(start + batch_size, n_products)
+            block = (self.tfidf_matrix[start:stop] @ matrix_t).toarray()
+            # A product is never its own neighbor
+            block[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind='stable')
+            self.similar_indices[start:stop] = np.take_along_axis(top, order, axis=1)
+            self.similar_scores[start:stop] = np.take_along_axis(top_scores, order, axis=1)
+
+    def get_similar_products(self, asin, n=5):
+        """Return up to n products most similar to the product with the given ASIN"""
+        if self.similar_indices is None:
+            self.build_similar_items_index(max(n, self.similar_items_k))
+        matches = np.flatnonzero(self.product_data['asin'].to_numpy() == asin)
+        if len(matches) == 0:
+            return []
+        recommendations = []
+        for idx, score in zip(self.similar_indices[matches[0]][:n], self.similar_scores[matches[0]][:n]):
+            if idx < 0 or score <= 0:
+                break
+            recommendations.append({
+                'asin': self.product_data.iloc[idx]['asin'],
+                'title': self.product_data.iloc[idx]['title'],
+                'price': float(self.product_data.iloc[idx]['price'])
+            })
+        return recommendations
 
     def build_cluster_model(self):
+        from sklearn.cluster import KMeans
+        from sklearn.preprocessing import StandardScaler
+
         print("Building cluster model...")
         if self.tfidf_matrix is None:
             self.build_cosine_model()
@@ -233,6 +271,8 @@ class AmazonProductRecommender:
 
     def get_recommendations(self, query, method='cosine', n=5):
         """Get product recommendations for a given query"""
+        from sklearn.metrics.pairwise import cosine_similarity
+
         if method == 'cosine' and self.cosine_model is None:
             self.build_cosine_model()
         if method == 'cluster' and self.cluster_model is None:
@@ -284,6 +324,8 @@ class AmazonProductRecommender:
     
     def get_recommendations_from_audio(self, audio_file_path, method='cosine', n=5):
         """Transcribe audio query and get product recommendations"""
+        from transcribe import transcribe_audio
+
         try:
             # Transcribe audio to text
             query = transcribe_audio(audio_file_path)
@@ -407,30 +449,7 @@ class AmazonProductRecommender:
 if __name__ == "__main__":
     # Create sample data (replacing load_amazon_data)
     print("Creating sample Amazon data for demonstration.")
-    categories = ['Electronics', 'Books', 'Home & Kitchen', 'Clothing', 'Sports & Outdoors', 
-                  'Beauty', 'Toys & Games', 'Grocery', 'Pet Supplies', 'Automotive']
-    brands = ['Amazon', 'Apple', 'Samsung', 'Sony', 'LG', 'Bose', 'Nike', 'Adidas', 
-              'Logitech', 'Microsoft', 'Dell', 'HP', 'Anker', 'JBL', 'Canon', 'Nikon']
-    
-    n_samples = 2000
-    titles = []
-    for _ in range(n_samples):
-        brand = random.choice(brands)
-        category = random.choice(categories)
-        product_type = random.choice(['Pro', 'Ultra', 'Max', 'Premium', 'Basic', 'Plus', 'Lite', ''])
-        model = random.choice(['X', 'S', 'A', 'Z', 'M', 'Q', 'V']) + str(random.randint(1, 100))
-        titles.append(f"{brand} {category.split()[0]} {product_type} {model}".strip())
-    
-    amazon_data = pd.DataFrame({
-        'asin': [f'B{i:09d}' for i in range(1, n_samples+1)],
-        'title': titles,
-        'description': [f"This is a great product with many features." for _ in range(n_samples)],
-        'category': np.random.choice(categories, n_samples),
-        'price': np.random.uniform(10, 500, n_samples).round(2),
-        'rating': np.random.uniform(1, 5, n_samples).round(1),
-        'review_count': np.random.randint(0, 2000, n_samples),
-        'sales_rank': np.random.randint(1, 500000, n_samples)
-    })
+    amazon_data = make_sample_catalog(n_samples=2000)
     
     # Initialize and run recommender
     recommender = AmazonProductRecommender(amazon_data)
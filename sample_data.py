@@ -0,0 +1,79 @@
+import random
+import numpy as np
+import pandas as pd
+
+CATEGORIES = ['Electronics', 'Books', 'Home & Kitchen', 'Clothing', 'Sports & Outdoors',
+              'Beauty', 'Toys & Games', 'Grocery', 'Pet Supplies', 'Automotive']
+BRANDS = ['Amazon', 'Apple', 'Samsung', 'Sony', 'LG', 'Bose', 'Nike', 'Adidas',
+          'Logitech', 'Microsoft', 'Dell', 'HP', 'Anker', 'JBL', 'Canon', 'Nikon']
+PRODUCT_WORDS = ['wireless', 'running', 'shoes', 'jacket', 'headphones', 'charger', 'cable', 'lamp',
+                 'mug', 'bottle', 'yoga', 'mat', 'speaker', 'watch', 'backpack', 'laptop', 'stand',
+                 'keyboard', 'mouse', 'case', 'camera', 'blender', 'pillow', 'blanket', 'toy', 'puzzle']
+
+def make_sample_catalog(n_samples=2000):
+    """
+    Synthetic Amazon catalog used for demos and benchmarks, in the column
+    layout recommendor.AmazonProductRecommender expects.
+    """
+    titles = []
+    for _ in range(n_samples):
+        brand = random.choice(BRANDS)
+        category = random.choice(CATEGORIES)
+        product_type = random.choice(['Pro', 'Ultra', 'Max', 'Premium', 'Basic', 'Plus', 'Lite', ''])
+        model = random.choice(['X', 'S', 'A', 'Z', 'M', 'Q', 'V']) + str(random.randint(1, 100))
+        titles.append(f"{brand} {category.split()[0]} {product_type} {model}".strip())
+
+    return pd.DataFrame({
+        'asin': [f'B{i:09d}' for i in range(1, n_samples+1)],
+        'title': titles,
+        'description': [f"This is a great product with many features." for _ in range(n_samples)],
+        'category': np.random.choice(CATEGORIES, n_samples),
+        'price': np.random.uniform(10, 500, n_samples).round(2),
+        'rating': np.random.uniform(1, 5, n_samples).round(1),
+        'review_count': np.random.randint(0, 2000, n_samples),
+        'sales_rank': np.random.randint(1, 500000, n_samples)
+    })
+
+def make_large_catalog(n_samples=100000, vocabulary_size=20000, n_topics=200, words_per_title=6, seed=42):
+    """
+    Larger synthetic catalog closer to real product text than make_sample_catalog:
+    every product belongs to a topic (product line) and draws its title words
+    from that topic's own Zipf-distributed slice of a shared vocabulary.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(PRODUCT_WORDS + [f"term{i}" for i in range(vocabulary_size - len(PRODUCT_WORDS))])
+    topic_size = max(words_per_title, 4 * vocabulary_size // n_topics)
+    topic_words = np.stack([rng.choice(vocabulary_size, topic_size, replace=False) for _ in range(n_topics)])
+
+    topics = rng.integers(0, n_topics, n_samples)
+    ranks = np.minimum(rng.zipf(1.5, size=(n_samples, words_per_title)), topic_size) - 1
+    words = vocabulary[topic_words[topics[:, None], ranks]]
+    brands = np.array(BRANDS)[rng.integers(0, len(BRANDS), n_samples)]
+    titles = pd.Series(brands).str.cat([pd.Series(words[:, i]) for i in range(words_per_title)], sep=' ')
+
+    return pd.DataFrame({
+        'asin': [f'B{i:09d}' for i in range(1, n_samples+1)],
+        'title': titles,
+        'category': np.array(CATEGORIES)[topics % len(CATEGORIES)],
+        'price': rng.uniform(10, 500, n_samples).round(2),
+        'rating': rng.uniform(1, 5, n_samples).round(1),
+        'review_count': rng.integers(0, 2000, n_samples),
+        'sales_rank': rng.integers(1, 500000, n_samples)
+    })
+
+def to_products_table(catalog):
+    """
+    Convert a synthetic catalog to the schema of the `products` SQLite table
+    that ml_module reads (stars, reviews, category_id, boughtInLastMonth, ...).
+    """
+    products = catalog.rename(columns={
+        'rating': 'stars',
+        'review_count': 'reviews',
+        'category': 'category_id',
+    })
+    # boughtInLastMonth grows with popularity, sales_rank shrinks with it
+    products['boughtInLastMonth'] = (500000 // catalog['sales_rank']).astype(int)
+    products['isBestSeller'] = catalog['sales_rank'] < 5000
+    products['imgUrl'] = "https://m.media-amazon.com/images/I/" + catalog['asin'] + ".jpg"
+    products['productURL'] = "https://www.amazon.com/dp/" + catalog['asin']
+    return products.drop(columns=['sales_rank', 'description'], errors='ignore')
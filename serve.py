@@ -0,0 +1,109 @@
+"""
+Preload-then-fork server for main:app.
+
+    python serve.py --workers 4 --port 8000
+
+`uvicorn main:app --workers N` starts every worker as a fresh interpreter, so
+each one loads its own copy of ml_module.recommender. Here the parent imports
+the app and loads the model once, binds the listening socket and then
+forks the workers, which serve from that socket. The model's arrays are either
+memory-mapped artifact files or buffers written before the fork and only read
+afterwards, so every worker shares the same physical pages; gc.freeze() keeps
+the garbage collector from touching (and so copying) the preloaded objects.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import time
+
+import uvicorn
+
+
+def bind_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock, log_level):
+    # Worker process: serve the inherited socket until told to stop
+    config = uvicorn.Config(app, log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve(host="127.0.0.1", port=8000, workers=2, log_level="info"):
+    # Scoring pools start per worker (in the app lifespan); split the CPUs between
+    # them unless configured explicitly
+    os.environ.setdefault("RECOMMEND_WORKERS", str(max(1, (os.cpu_count() or 1) // workers)))
+
+    start = time.perf_counter()
+    from main import app
+    from ml_module import get_recommender
+    get_recommender()
+    print(f"Model preloaded in {time.perf_counter() - start:.1f}s; forking {workers} workers")
+
+    sock = bind_socket(host, port)
+    # Everything allocated so far is moved out of the collector's reach, so its
+    # object headers are never written (and their pages never copied) in a worker
+    gc.collect()
+    gc.freeze()
+
+    children = {}
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                run_worker(app, sock, log_level)
+            finally:
+                os._exit(0)
+        children[pid] = time.monotonic()
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+
+    # Supervise: replace workers that die, until asked to stop
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = children.pop(pid, None)
+        if not stopping and started is not None:
+            print(f"Worker {pid} exited with status {status}, restarting")
+            if time.monotonic() - started < 1:
+                time.sleep(1)  # Don't spin on a worker that fails at startup
+            spawn()
+    sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve main:app from workers forked after loading the model")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.log_level)
@@ -1,42 +1,184 @@
+import itertools
+import os
 import sqlite3
+import time
+import uuid
 import pandas as pd
+from catalog_snapshot import read_snapshot
+from query_db import check_query_plans, quote_identifier, sqlite_values
+
+# Declared types of the known product columns; product_id is an explicit rowid
+# alias so rowids (which the full-text index refers to) survive VACUUM
+PRODUCT_SCHEMA = {
+    "asin": "TEXT NOT NULL",
+    "title": "TEXT NOT NULL",
+    "imgUrl": "TEXT",
+    "productURL": "TEXT",
+    "stars": "REAL NOT NULL DEFAULT 0",
+    "reviews": "INTEGER NOT NULL DEFAULT 0",
+    "price": "REAL NOT NULL DEFAULT 0",
+    "listPrice": "REAL",
+    "category_id": "INTEGER",
+    "isBestSeller": "INTEGER NOT NULL DEFAULT 0",
+    "boughtInLastMonth": "INTEGER NOT NULL DEFAULT 0",
+}
+
+# Indexes for get_products: every filter combination is sorted by
+# stars DESC, boughtInLastMonth DESC, so each index leads with an equality
+# column (if any) followed by that order, and carries the remaining filter
+# columns so filtering never has to visit the table row
+PRODUCT_INDEXES = {
+    "idx_products_rank": "stars DESC, boughtInLastMonth DESC, price, reviews, category_id, isBestSeller",
+    "idx_products_category_rank": "category_id, stars DESC, boughtInLastMonth DESC, price, reviews, isBestSeller",
+    "idx_products_bestseller_rank": "isBestSeller, stars DESC, boughtInLastMonth DESC, price, reviews, category_id",
+    "idx_products_asin": "asin",
+}
+
+def sqlite_type(dtype):
+    # Declared type for CSV columns outside PRODUCT_SCHEMA
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+# Rows per CSV chunk; one transaction per chunk keeps memory flat for any file size
+CHUNK_SIZE = 50000
 
 # Step 1: Connect to SQLite database
 # Creates 'products.db' if it doesn’t exist
 conn = sqlite3.connect("products.db")
 cursor = conn.cursor()
+# Bulk-load settings: no rollback journal and no fsync until the load is done;
+# a crash mid-load leaves a database that is rebuilt by rerunning this script
+cursor.execute("PRAGMA journal_mode=OFF")
+cursor.execute("PRAGMA synchronous=OFF")
+cursor.execute("PRAGMA cache_size=-65536")
+
+# Step 2: Stream the cleaned catalog in chunks, from the columnar snapshot
+# written by data_grep.py unless the CSV is newer (e.g. edited by hand, or
+# cleaned again without a snapshot)
+SNAPSHOT_PATH = "merged_with_category_cleaned.snapshot"
+CSV_PATH = "merged_with_category_cleaned.csv"
+
+def modified_at(path):
+    return os.path.getmtime(path) if os.path.exists(path) else float("-inf")
+
+if modified_at(os.path.join(SNAPSHOT_PATH, "manifest.json")) >= modified_at(CSV_PATH):
+    source = SNAPSHOT_PATH
+    chunks = read_snapshot(source).iter_frames(CHUNK_SIZE)
+else:
+    source = CSV_PATH
+    chunks = pd.read_csv(source, chunksize=CHUNK_SIZE)
+first_chunk = next(chunks)
+print(f"Loaded first chunk of {source}:")
+print(first_chunk.head())  # Preview the data
 
-# Step 2: Create the products table
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS products (
-        product_id INTEGER PRIMARY KEY,
-        name TEXT NOT NULL,
-        category TEXT NOT NULL,
-        price REAL NOT NULL,
-        size TEXT,
-        description TEXT
+# Step 3: Create the products table with typed columns
+# Rebuilding drops the old table, its indexes and the full-text index with its triggers
+cursor.execute("DROP TABLE IF EXISTS products_fts")
+cursor.execute("DROP TABLE IF EXISTS products_version")
+cursor.execute("DROP TABLE IF EXISTS products")
+csv_columns = list(first_chunk.columns)
+columns = ["product_id INTEGER PRIMARY KEY"]
+columns += [f"{quote_identifier(name)} {PRODUCT_SCHEMA.get(name) or sqlite_type(first_chunk[name].dtype)}"
+            for name in csv_columns]
+cursor.execute("CREATE TABLE products (" + ", ".join(columns) + ")")
+print("Table 'products' created.")
+
+# Step 4: Insert the chunks, one transaction each; product_id is assigned by SQLite
+# and the indexes are only built after the load
+insert_sql = (f"INSERT INTO products ({', '.join(map(quote_identifier, csv_columns))}) "
+              f"VALUES ({', '.join('?' for _ in csv_columns)})")
+loaded = 0
+start = time.perf_counter()
+for chunk in itertools.chain([first_chunk], chunks):
+    chunk = chunk[csv_columns]
+    # The cleaner writes missing text as "", which the CSV reader parses back as NaN
+    text_columns = [c for c in csv_columns if not pd.api.types.is_numeric_dtype(chunk[c].dtype)]
+    chunk = chunk.fillna({c: "" for c in text_columns})
+    chunk = sqlite_values(chunk)
+    with conn:
+        conn.executemany(insert_sql, chunk.itertuples(index=False, name=None))
+    loaded += len(chunk)
+    print(f"  {loaded} rows loaded ({loaded / (time.perf_counter() - start):,.0f} rows/s)")
+print(f"Data inserted into 'products' table: {loaded} rows in {time.perf_counter() - start:.1f}s.")
+
+# Step 5: Build the FTS5 full-text index over the text columns
+# External-content table: it stores only the index and reads text from products
+fts_columns = [c for c in ("title", "description") if c in csv_columns]
+cursor.execute(f'''
+    CREATE VIRTUAL TABLE products_fts USING fts5(
+        {", ".join(fts_columns)}, content='products', content_rowid='product_id',
+        tokenize='porter unicode61'
     )
 ''')
-print("Table 'products' created or already exists.")
+cursor.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+# Triggers keep the index in sync with later inserts, updates and deletes
+new_values = ", ".join(f"new.{c}" for c in fts_columns)
+old_values = ", ".join(f"old.{c}" for c in fts_columns)
+cursor.executescript(f'''
+    CREATE TRIGGER products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, {", ".join(fts_columns)}) VALUES (new.product_id, {new_values});
+    END;
+    CREATE TRIGGER products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, {", ".join(fts_columns)})
+        VALUES ('delete', old.product_id, {old_values});
+    END;
+    CREATE TRIGGER products_fts_update AFTER UPDATE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, {", ".join(fts_columns)})
+        VALUES ('delete', old.product_id, {old_values});
+        INSERT INTO products_fts(rowid, {", ".join(fts_columns)}) VALUES (new.product_id, {new_values});
+    END;
+''')
+print(f"Full-text index 'products_fts' built over {fts_columns}.")
+
+# Version for model_store.db_fingerprint: a new build id per rebuild, and a
+# change counter bumped by every row written after the load, so the model
+# artifacts also see updates that are still in the WAL
+cursor.executescript(f'''
+    CREATE TABLE products_version (
+        id INTEGER PRIMARY KEY CHECK (id = 0), build TEXT NOT NULL, changes INTEGER NOT NULL
+    );
+    INSERT INTO products_version VALUES (0, '{uuid.uuid4().hex}', 0);
+    CREATE TRIGGER products_version_insert AFTER INSERT ON products BEGIN
+        UPDATE products_version SET changes = changes + 1 WHERE id = 0;
+    END;
+    CREATE TRIGGER products_version_delete AFTER DELETE ON products BEGIN
+        UPDATE products_version SET changes = changes + 1 WHERE id = 0;
+    END;
+    CREATE TRIGGER products_version_update AFTER UPDATE ON products BEGIN
+        UPDATE products_version SET changes = changes + 1 WHERE id = 0;
+    END;
+''')
+
+# Step 6: Create the secondary indexes and collect planner statistics
+for name, index_columns in PRODUCT_INDEXES.items():
+    cursor.execute(f"CREATE INDEX {name} ON products ({index_columns})")
+cursor.execute("ANALYZE")
+print(f"Indexes created: {list(PRODUCT_INDEXES)}")
+conn.commit()
 
-# Step 3: Load the cleaned CSV into a DataFrame
-df = pd.read_csv("merged_with_category_cleaned.csv")
-print("Loaded cleaned_data.csv:")
-print(df.head())  # Preview the data
+# Back to durable settings; WAL lets the read-only API connections run during later writes
+cursor.execute("PRAGMA journal_mode=WAL")
+cursor.execute("PRAGMA synchronous=NORMAL")
 
-# Step 4: Insert DataFrame into SQLite table
-# 'if_exists="replace"' overwrites the table if it already exists
-df.to_sql("products", conn, if_exists="replace", index=False)
-print("Data inserted into 'products' table.")
+# Step 7: Check that the common filter combinations use the indexes
+problems = check_query_plans(conn)
+if problems:
+    for filters, plan in problems:
+        print(f"⚠️ Warning: {filters} is planned as {plan}")
+else:
+    print("✅ No filter combination needs a full table scan or a temporary sort.")
 
-# Step 5: Verify the data was loaded
+# Step 8: Verify the data was loaded
 cursor.execute("SELECT * FROM products LIMIT 5")
 rows = cursor.fetchall()
 print("Sample data from database:")
 for row in rows:
     print(row)
 
-# Step 6: Commit changes and close the connection
+# Step 9: Commit changes and close the connection
 conn.commit()
 conn.close()
 print("Database setup complete! File saved as 'products.db'.")
@@ -0,0 +1,103 @@
+"""
+Inverted term index over TF-IDF product vectors.
+
+Every vocabulary term has a posting list of (product, weight) pairs sorted by
+weight, highest first ("impact order"). A query visits only the postings of
+its own terms, most valuable term first, and stops reading a posting list as
+soon as the remaining postings cannot lift an unseen product into the top n.
+The products it saw are returned as candidates; because every product left
+out provably scores below the n-th best, exact re-scoring of the candidates
+gives the same ranking as scoring the whole catalog.
+"""
+import numpy as np
+
+# Relative slack on the pruning bounds so float32 postings never prune a product
+# whose exact float64 score would still make the top n
+_BOUND_SLACK = 1e-5
+
+
+class InvertedIndex:
+    def fit(self, product_vectors):
+        by_term = product_vectors.tocsc()
+        by_term.sum_duplicates()
+        n_terms = by_term.shape[1]
+        term_of_posting = np.repeat(np.arange(n_terms), np.diff(by_term.indptr))
+        # Group by term, then by descending weight; lexsort is stable so equal
+        # weights stay in ascending product order
+        order = np.lexsort((-by_term.data, term_of_posting))
+        self.postings_products = by_term.indices[order].astype(np.int32)
+        self.postings_weights = by_term.data[order].astype(np.float32)
+        self.term_offsets = by_term.indptr.astype(np.int64)
+
+        starts = self.term_offsets[:-1]
+        non_empty = np.diff(self.term_offsets) > 0
+        self.max_weights = np.zeros(n_terms, dtype=np.float32)
+        self.max_weights[non_empty] = self.postings_weights[starts[non_empty]]
+        print(f"Inverted index built with {len(self.postings_products)} postings over {n_terms} terms")
+        return self
+
+    def search(self, query_vector, top_n, accept=None, boost=None, max_boost=1.0):
+        """
+        Collect the candidates that can reach the top_n of the exact ranking.
+        Args:
+            query_vector (scipy.sparse matrix): 1 x n_terms TF-IDF query
+            top_n (int): Number of results the caller will keep
+            accept (callable): positions -> bool mask of products passing the filters
+            boost (callable): positions -> multiplier (>= 1) applied to their scores
+            max_boost (float): Upper bound of boost over all products
+        Returns:
+            np.ndarray: Ascending positions of every product that shares a term with
+                the query and was not pruned; all of them have a positive score
+        """
+        query_vector = query_vector.tocsr()
+        terms = query_vector.indices
+        upper_bounds = query_vector.data * self.max_weights[terms]
+        order = np.argsort(-upper_bounds, kind='stable')
+        terms, query_weights, upper_bounds = terms[order], query_vector.data[order], upper_bounds[order]
+        # remaining[i] = best possible contribution of all terms after term i
+        remaining = np.concatenate([np.cumsum(upper_bounds[::-1])[::-1][1:], [0.0]])
+
+        seen = np.empty(0, dtype=np.int32)
+        partial = np.empty(0, dtype=np.float64)
+        threshold = 0.0
+        for term, weight, rest in zip(terms, query_weights, remaining):
+            start, stop = self.term_offsets[term], self.term_offsets[term + 1]
+            if threshold > 0:
+                # An unseen product only in this posting tail and later terms scores
+                # at most (weight * w + rest) * max_boost; skip the tail below threshold
+                cutoff = threshold / (max_boost * (1 + _BOUND_SLACK)) - rest * (1 + _BOUND_SLACK)
+                if cutoff > 0:
+                    # Postings are in descending weight, so the ones to keep are a prefix
+                    weights_asc = self.postings_weights[start:stop][::-1]
+                    stop -= np.searchsorted(weights_asc, cutoff / weight, side='left')
+            if stop <= start:
+                continue
+
+            products = self.postings_products[start:stop]
+            contributions = weight * self.postings_weights[start:stop].astype(np.float64)
+            seen, inverse = np.unique(np.concatenate([seen, products]), return_inverse=True)
+            partial = np.bincount(inverse, weights=np.concatenate([partial, contributions]), minlength=len(seen))
+
+            # Partial scores only grow, so the top_n-th best partial score among
+            # accepted products is a lower bound on the final top_n-th score
+            lower = partial if boost is None else partial * boost(seen)
+            if accept is not None:
+                lower = lower[accept(seen)]
+            if len(lower) >= top_n > 0:
+                threshold = max(threshold, np.partition(lower, len(lower) - top_n)[len(lower) - top_n])
+        return seen.astype(np.intp)
+
+    def to_arrays(self):
+        return {
+            'postings_products': self.postings_products,
+            'postings_weights': self.postings_weights,
+            'term_offsets': self.term_offsets,
+            'max_weights': self.max_weights,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        self = cls()
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        return self
@@ -1,47 +1,96 @@
-import whisper
 import os
+import subprocess
+import tempfile
+import numpy as np
 from pydub import AudioSegment
-from pydub.exceptions import CouldntDecodeError
+from transcription_pool import TranscriptionPool
 
-# Load Whisper model globally (use 'base' for speed in a hackathon)
-model = whisper.load_model("base")
+SAMPLE_RATE = 16000  # Whisper expects 16kHz mono
 
-def convert_audio(input_path: str) -> str:
+# Shared pool of Whisper models, loaded on first use ('base' by default for speed;
+# configured with TRANSCRIBE_MODEL / TRANSCRIBE_WORKERS / TRANSCRIBE_MAX_QUEUE / TRANSCRIBE_TIMEOUT_S)
+transcription_pool = TranscriptionPool.from_env()
+
+def decode_audio(source) -> np.ndarray:
     """
-    Converts audio to WAV (16-bit PCM, mono, 16kHz) for Whisper compatibility.
-    Returns path to converted file.
+    Decodes audio to the float32 mono 16kHz samples Whisper takes, in memory:
+    ffmpeg reads the upload from a pipe and writes raw PCM to another, so
+    nothing is written to disk and Whisper doesn't decode a WAV file again.
+    Args:
+        source: Audio file path, bytes, or a binary file-like object
     """
+    if isinstance(source, (str, os.PathLike)):
+        data, input_path = None, os.fspath(source)
+    else:
+        data = source if isinstance(source, (bytes, bytearray, memoryview)) else source.read()
+        input_path = "pipe:0"
     try:
-        output_path = "converted_audio.wav"
-        audio = AudioSegment.from_file(input_path)
-        audio = audio.set_channels(1).set_frame_rate(16000)  # Whisper expects 16kHz mono
-        audio.export(output_path, format="wav", codec="pcm_s16le")
-        return output_path
-    except CouldntDecodeError:
-        raise Exception(f"Failed to decode audio file: {input_path}")
-    except Exception as e:
-        raise Exception(f"Audio conversion error: {str(e)}")
+        try:
+            pcm = run_ffmpeg(input_path, data)
+        except subprocess.CalledProcessError:
+            if data is None:
+                raise
+            # Some containers (e.g. MP4 with its index at the end) can't be read
+            # from a pipe; only those go through a temporary file
+            with tempfile.NamedTemporaryFile(prefix="upload_") as f:
+                f.write(data)
+                f.flush()
+                pcm = run_ffmpeg(f.name)
+    except subprocess.CalledProcessError as e:
+        error = e.stderr.decode(errors="replace").strip().splitlines()
+        raise Exception(f"Failed to decode audio{f' file: {input_path}' if data is None else ''}: "
+                        f"{error[-1] if error else 'ffmpeg failed'}")
+    except FileNotFoundError:
+        raise Exception(f"Audio decoding error: '{AudioSegment.converter}' was not found")
+    return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+
+def run_ffmpeg(input_path, data=None):
+    # Decode and resample to 16-bit mono PCM at SAMPLE_RATE on stdout
+    command = [AudioSegment.converter, "-nostdin", "-threads", "0", "-i", input_path,
+               "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "pipe:1"]
+    return subprocess.run(command, input=data, capture_output=True, check=True).stdout
 
-def transcribe_audio(file_path: str) -> str:
+def transcribe_audio(source, transcript_path: str | None = None) -> str:
     """
-    Transcribes audio file using Whisper and returns the text.
+    Transcribes audio using the shared Whisper pool and returns the text.
+    Args:
+        source: Audio file path, bytes or binary file-like object, in any format ffmpeg reads
+        transcript_path (str): Also save the transcript to this file
     """
     try:
         print("Transcribing audio...")
-        converted_path = convert_audio(file_path)
-        result = model.transcribe(converted_path)
+        result = transcription_pool.transcribe(decode_audio(source))
         transcript = result["text"].strip()
-        
+
         print(f"Transcription complete: {transcript}")
-        # Optionally save transcript (remove if not needed for hackathon)
-        with open("transcript.txt", "w") as f:
-            f.write(transcript)
-        
-        # Clean up temporary file
-        if os.path.exists(converted_path):
-            os.remove(converted_path)
-        
+        if transcript_path:
+            with open(transcript_path, "w") as f:
+                f.write(transcript)
+
         return transcript
     except Exception as e:
         raise Exception(f"Transcription error: {str(e)}")
 
+class AudioStream:
+    """
+    Audio received in chunks, e.g. over a WebSocket: either raw 16-bit mono PCM
+    at SAMPLE_RATE, or a container/codec stream (WebM/Opus, Ogg, MP3, ...) that
+    is decoded again from the start whenever the samples are needed.
+    """
+
+    def __init__(self, pcm=False):
+        self.pcm = pcm
+        self.data = bytearray()
+
+    def __len__(self):
+        return len(self.data)
+
+    def append(self, chunk):
+        self.data.extend(chunk)
+
+    def samples(self) -> np.ndarray:
+        """Float32 samples received so far (a partial stream decodes up to its last complete frame)"""
+        if self.pcm:
+            pcm = bytes(self.data[:len(self.data) // 2 * 2])
+            return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+        return decode_audio(bytes(self.data))
@@ -0,0 +1,154 @@
+"""
+Bounded pool of loaded Whisper models for concurrent transcription.
+
+Each worker thread holds its own model (loaded on first use, so processes that
+never transcribe never load one); PyTorch releases the GIL while it computes,
+so the workers run in parallel, each limited to its share of the CPU threads.
+
+Admission control is worker_pool.BoundedPool's, as for scoring: at most
+workers + max_queue requests are accepted at a time, anything beyond that is
+rejected immediately with Overloaded, and every request waits at most `timeout` seconds.
+stats() reports throughput and queue/latency percentiles over recent requests.
+"""
+import collections
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from worker_pool import BoundedPool
+
+# Requests kept for the latency percentiles in stats()
+LATENCY_WINDOW = 1000
+# Sample rate of the audio arrays Whisper takes (whisper.audio.SAMPLE_RATE)
+SAMPLE_RATE = 16000
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class TranscriptionPool(BoundedPool):
+    task = "Transcription"
+
+    def __init__(self, model_name="base", workers=None, max_queue=8, timeout=60.0, device="cpu"):
+        super().__init__(workers or max(1, (os.cpu_count() or 1) // 2), max_queue, timeout)
+        self.model_name = model_name
+        self.device = device
+        # One slot per worker; a slot holds that worker's model once it is loaded
+        self._models = queue.Queue()
+        self.models_loaded = 0
+        self.started_at = None
+        self.busy_s = 0.0
+        self.audio_s = 0.0
+        self.queue_waits = collections.deque(maxlen=LATENCY_WINDOW)
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            model_name=os.environ.get("TRANSCRIBE_MODEL", "base"),
+            workers=int(os.environ.get("TRANSCRIBE_WORKERS", 0)) or None,
+            max_queue=int(os.environ.get("TRANSCRIBE_MAX_QUEUE", 8)),
+            timeout=float(os.environ.get("TRANSCRIBE_TIMEOUT_S", 60.0)),
+            device=os.environ.get("TRANSCRIBE_DEVICE", "cpu"),
+        )
+
+    def start(self):
+        with self._lock:
+            if self.executor is not None:
+                return
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="transcribe")
+            for _ in range(self.workers - self._models.qsize()):
+                self._models.put(None)
+            self.started_at = time.perf_counter()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def load_model(self):
+        import torch
+        import whisper
+
+        # Every worker computes at once, so each gets its share of the cores
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // self.workers))
+        start = time.perf_counter()
+        model = whisper.load_model(self.model_name, device=self.device)
+        with self._lock:
+            self.models_loaded += 1
+        print(f"Whisper model '{self.model_name}' loaded in {time.perf_counter() - start:.1f}s")
+        return model
+
+    def stats(self):
+        with self._lock:
+            elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+            queue_waits = list(self.queue_waits)
+            latencies = list(self.latencies)
+            return {
+                "model": self.model_name,
+                "workers": self.workers,
+                "models_loaded": self.models_loaded,
+                "capacity": self.capacity,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "requests_per_s": self.completed / elapsed if elapsed else 0.0,
+                # Seconds of audio transcribed per second of worker time (above 1 is faster than real time)
+                "realtime_factor": self.audio_s / self.busy_s if self.busy_s else None,
+                "queue_wait_p50_s": percentile(queue_waits, 0.5),
+                "queue_wait_p95_s": percentile(queue_waits, 0.95),
+                "latency_p50_s": percentile(latencies, 0.5),
+                "latency_p95_s": percentile(latencies, 0.95),
+            }
+
+    def submit(self, audio, **options):
+        """
+        Transcribe on a worker holding a loaded model; returns a Future of
+        Whisper's result dict.
+        Args:
+            audio: Audio file path, or float32 samples at 16 kHz
+            options: Passed on to model.transcribe (e.g. language, initial_prompt)
+        Raises:
+            Overloaded: The pool is at capacity
+        """
+        self.start()
+        return super().submit(self._transcribe, time.perf_counter(), audio, options)
+
+    def transcribe(self, audio, **options):
+        """Blocking submit(): Whisper's result dict, within the timeout"""
+        return self.result(self.submit(audio, **options))
+
+    async def run(self, audio, **options):
+        """Awaitable submit(): Whisper's result dict, within the timeout"""
+        return await self.wait(self.submit(audio, **options))
+
+    def _transcribe(self, submitted_at, audio, options):
+        started_at = time.perf_counter()
+        model = self._models.get()
+        try:
+            if model is None:
+                model = self.load_model()
+            options.setdefault("fp16", self.device != "cpu")
+            result = model.transcribe(audio, **options)
+        finally:
+            # A slot whose model failed to load stays empty and is retried next time
+            self._models.put(model)
+        finished_at = time.perf_counter()
+        if isinstance(audio, str):
+            audio_s = result["segments"][-1]["end"] if result.get("segments") else 0.0
+        else:
+            audio_s = len(audio) / SAMPLE_RATE
+        with self._lock:
+            self.busy_s += finished_at - started_at
+            self.audio_s += audio_s
+            self.queue_waits.append(started_at - submitted_at)
+            self.latencies.append(finished_at - submitted_at)
+        return result
@@ -0,0 +1,191 @@
+"""
+Bounded executor for CPU-heavy recommendation scoring behind the async API.
+
+Modes:
+    process  scoring runs in a pool of forked worker processes, which share the
+             already-loaded read-only model with the parent copy-on-write
+    thread   scoring runs in a thread pool inside the server process
+    inline   scoring runs on the event loop (debugging only)
+
+Admission control caps the work in flight at workers + max_queue; anything
+beyond that is rejected immediately with Overloaded instead of queueing
+without bound, and every request waits at most `timeout` seconds.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+
+class Overloaded(Exception):
+    """Raised when the pool is at capacity or a request waited longer than the timeout"""
+
+
+class BoundedPool:
+    """
+    Admission control and timeouts around an executor, shared by ScoringPool
+    and transcription_pool.TranscriptionPool. Subclasses create self.executor
+    in start() and name the work in error messages through `task`.
+    """
+    task = "Work"
+
+    def __init__(self, workers, max_queue, timeout):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.executor = None
+        self._lock = threading.Lock()
+        self._restart_lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.restarts = 0
+
+    @property
+    def capacity(self):
+        return self.workers + self.max_queue
+
+    def submit(self, fn, *args):
+        """
+        Submit fn(*args) to the executor and return its Future.
+        Raises:
+            Overloaded: The pool is at capacity or shut down
+        """
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.rejected += 1
+                raise Overloaded(f"{self.task} pool is at capacity")
+            self.in_flight += 1
+        executor = self.executor
+        try:
+            if executor is None:
+                raise RuntimeError
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                future = self._restart(executor).submit(fn, *args)
+        except RuntimeError:  # Shut down meanwhile
+            with self._lock:
+                self.in_flight -= 1
+            raise Overloaded(f"{self.task} pool is shut down")
+        # Release the slot when the work actually finishes, not when the caller
+        # stops waiting: a timed-out task still occupies a worker until it ends
+        future.add_done_callback(self._release)
+        return future
+
+    def result(self, future):
+        """Block for the result of a submitted Future, within the timeout"""
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:
+            raise self._timed_out(future)
+        except BrokenProcessPool:
+            raise self._worker_died()
+
+    async def wait(self, future):
+        """Await the result of a submitted Future, within the timeout"""
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out(future)
+        except BrokenProcessPool:
+            raise self._worker_died()
+
+    def _timed_out(self, future):
+        future.cancel()
+        with self._lock:
+            self.timed_out += 1
+        return Overloaded(f"{self.task} did not finish within {self.timeout}s")
+
+    def _worker_died(self):
+        # The next submit() replaces the broken executor
+        return Overloaded(f"A {self.task.lower()} worker process died")
+
+    def _restart(self, broken):
+        """
+        Replace an executor that a dead worker process (e.g. OOM-killed) left
+        broken; every later submission to it would fail.
+        Returns:
+            The executor to submit to
+        """
+        with self._restart_lock:
+            if self.executor is broken:
+                print(f"{self.task} pool: a worker process died, restarting the executor")
+                self.start()
+                broken.shutdown(wait=False, cancel_futures=True)
+                with self._lock:
+                    self.restarts += 1
+            return self.executor
+
+    def _release(self, future):
+        with self._lock:
+            self.in_flight -= 1
+            if future.cancelled():
+                return
+            if future.exception() is None:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+
+class ScoringPool(BoundedPool):
+    task = "Scoring"
+
+    def __init__(self, mode="process", workers=None, max_queue=32, timeout=5.0):
+        if mode not in ("process", "thread", "inline"):
+            raise ValueError("mode must be 'process', 'thread' or 'inline'")
+        if mode == "process" and "fork" not in multiprocessing.get_all_start_methods():
+            # Spawned workers would each re-import and reload the model
+            mode = "thread"
+        super().__init__(workers or os.cpu_count() or 1, max_queue, timeout)
+        self.mode = mode
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            mode=os.environ.get("RECOMMEND_EXECUTOR", "process"),
+            workers=int(os.environ.get("RECOMMEND_WORKERS", 0)) or None,
+            max_queue=int(os.environ.get("RECOMMEND_MAX_QUEUE", 32)),
+            timeout=float(os.environ.get("RECOMMEND_TIMEOUT_S", 5.0)),
+        )
+
+    def start(self):
+        # Create the pool only after the model is loaded, so forked workers inherit it
+        if self.mode == "process":
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("fork"))
+        elif self.mode == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scoring")
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "restarts": self.restarts,
+            }
+
+    async def run(self, fn, *args):
+        """
+        Run fn(*args) on the pool and return its result.
+        Raises:
+            Overloaded: The pool is full, or the result did not arrive within the timeout
+        """
+        if self.executor is None:
+            return fn(*args)
+        return await self.wait(self.submit(fn, *args))